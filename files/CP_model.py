@@ -0,0 +1,229 @@
+from ortools.sat.python import cp_model
+
+from instance import Instance, Solution
+from lower_bound import lower_bound, print_gap
+from perf import PerfCounters
+from solution_io import format_solution
+
+
+class _SolutionPublisher(cp_model.CpSolverSolutionCallback):
+    '''pass every improving solution of the search to on_solution(solution, seconds)'''
+
+    def __init__(self, model) -> None:
+        super().__init__()
+        self.model = model
+
+    def on_solution_callback(self) -> None:
+        self.model.on_solution(self.model._solution_from(self.Value), self.WallTime())
+
+
+class _2DBinPackingCP(cp_model.CpModel):
+
+    def __init__(self, file_path: str, time_limit: int = 600, hint: Solution = None, on_solution=None,
+                 silent: bool = False, instance: Instance = None) -> None:
+        super().__init__()
+        self.file_path = file_path
+        # the instance itself, rather than its file
+        self.instance = instance
+        # do not print the placement of every rect
+        self.silent = silent
+        # a known solution, to start the search from and to bound the cost
+        self.hint = hint
+        # called on each improving solution, with the solution and the seconds since the start of the search
+        self.on_solution = on_solution
+        self.solver = cp_model.CpSolver()
+        # time limit
+        self.solver.parameters.max_time_in_seconds = time_limit
+        # per-phase timings and counters
+        self.perf = PerfCounters()
+
+    def __read_input(self) -> None:
+        if self.instance is None:
+            self.instance = Instance.from_file(self.file_path)
+
+    def __preprocess(self) -> None:
+        self.n_rectangles, self.n_trucks = self.instance.rect_count, self.instance.truck_count
+        # width and height of rectangles, width, height and cost of trucks
+        self.rectangles, self.trucks = self.instance.rect_list(), self.instance.truck_list()
+
+        # (weak) upper bound of coordinates
+        self.max_width, self.max_height = int(self.instance.truck_widths.max()), int(self.instance.truck_heights.max())
+
+        # lower bound of the cost, used to report the gap and to stop as soon as it is reached
+        self.lower_bound = lower_bound(self.rectangles, self.trucks)
+
+    def __set_variables_and_constraints(self) -> None:
+        # truck[i] = 1 iff it is used
+        self.is_use_truck = [self.NewIntVar(0, 1, f'is_use_truck[{i}]') for i in range(self.n_trucks)]
+
+        # rotate[i] = 1 iff rectangle[i] rotates 90 degree
+        self.rotate = [self.NewIntVar(0, 1, f'rotate[{i}]') for i in range(self.n_rectangles)]
+
+        # truck_index[i] is the index of the truck in which rectangle[i] should be placed
+        self.truck_index = [self.NewIntVar(0, self.n_trucks - 1, f'truck_index[{i}]') for i in range(self.n_rectangles)]
+
+        # coordinates
+        self.left = []
+        self.right = []
+        self.top = []
+        self.bottom = []
+
+        for i in range(self.n_rectangles):
+            # weak upper bound
+            self.left.append(self.NewIntVar(0, self.max_width, f'left[{i}]'))
+            self.right.append(self.NewIntVar(0, self.max_width, f'right[{i}]'))
+            self.top.append(self.NewIntVar(0, self.max_height, f'top[{i}]'))
+            self.bottom.append(self.NewIntVar(0, self.max_height, f'bottom[{i}]'))
+
+            self.Add(self.right[i] == self.left[i] + self.rectangles[i][0]).OnlyEnforceIf(self.rotate[i].Not())
+            self.Add(self.right[i] == self.left[i] + self.rectangles[i][1]).OnlyEnforceIf(self.rotate[i])
+            self.Add(self.top[i] == self.bottom[i] + self.rectangles[i][1]).OnlyEnforceIf(self.rotate[i].Not())
+            self.Add(self.top[i] == self.bottom[i] + self.rectangles[i][0]).OnlyEnforceIf(self.rotate[i])
+
+        for i in range(self.n_rectangles - 1):
+            for j in range(i + 1, self.n_rectangles):
+                b1 = self.NewBoolVar(f'b1[{i}][{j}]')
+                t1 = self.NewIntVar(0, 1, f't1[{i}][{j}]')
+                self.Add(self.right[i] <= self.left[j]).OnlyEnforceIf(b1)
+                self.Add(t1 == 1).OnlyEnforceIf(b1)
+                self.Add(t1 == 0).OnlyEnforceIf(b1.Not())
+
+                b2 = self.NewBoolVar(f"b2[{i}][{j}]")
+                t2 = self.NewIntVar(0, 1, f"t2[{i}][{j}]")
+                self.Add(self.right[j] <= self.left[i]).OnlyEnforceIf(b2)
+                self.Add(t2 == 1).OnlyEnforceIf(b2)
+                self.Add(t2 == 0).OnlyEnforceIf(b2.Not())
+
+                b3 = self.NewBoolVar(f"b3[{i}][{j}]")
+                t3 = self.NewIntVar(0, 1, f"t3[{i}][{j}]")
+                self.Add(self.top[i] <= self.bottom[j]).OnlyEnforceIf(b3)
+                self.Add(t3 == 1).OnlyEnforceIf(b3)
+                self.Add(t3 == 0).OnlyEnforceIf(b3.Not())
+
+                b4 = self.NewBoolVar(f"b4[{i}][{j}]")
+                t4 = self.NewIntVar(0, 1, f"t4[{i}][{j}]")
+                self.Add(self.top[j] <= self.bottom[i]).OnlyEnforceIf(b4)
+                self.Add(t4 == 1).OnlyEnforceIf(b4)
+                self.Add(t4 == 0).OnlyEnforceIf(b4.Not())
+
+                # non-overlap: if two self.rectangles are putted into the same truck, one of 4 conditions above must be satisfied
+                b0 = self.NewBoolVar('b0')
+                self.Add(self.truck_index[i] == self.truck_index[j]).OnlyEnforceIf(b0)
+                self.Add(self.truck_index[i] != self.truck_index[j]).OnlyEnforceIf(b0.Not())
+                self.Add(t1 + t2 + t3 + t4 >= 1).OnlyEnforceIf(b0)
+                self.Add(t1 + t2 + t3 + t4 == 0).OnlyEnforceIf(b0.Not())
+
+        # if truck_index[i] = j, i.e. rectangles[i] is putted in trucks[j], its width and height must fit this truck (tight upper bound)
+        for i in range(self.n_rectangles):
+            for j in range(self.n_trucks):
+                c = self.NewBoolVar('c')
+                self.Add(self.truck_index[i] == j).OnlyEnforceIf(c)
+                self.Add(self.truck_index[i] != j).OnlyEnforceIf(c.Not())
+                self.Add(self.right[i] <= self.trucks[j][0]).OnlyEnforceIf(c)
+                self.Add(self.top[i] <= self.trucks[j][1]).OnlyEnforceIf(c)
+
+        for j in range(self.n_trucks):
+            # is_put_to_truck[i] = 0 means that rectangle[i] not in the current truck
+            is_put_to_truck = [self.NewIntVar(0, 1, f'{i}') for i in range(self.n_rectangles)]
+            for i in range(self.n_rectangles):
+                
+                d = self.NewBoolVar('d')
+                
+                self.Add(self.truck_index[i] == j).OnlyEnforceIf(d)
+                
+                self.Add(is_put_to_truck[i] == 1).OnlyEnforceIf(d)
+                
+                self.Add(self.truck_index[i] != j).OnlyEnforceIf(d.Not())
+                
+                self.Add(is_put_to_truck[i] == 0).OnlyEnforceIf(d.Not())
+            
+            e = self.NewBoolVar('e')
+            
+            self.Add(sum(is_put_to_truck) == 0).OnlyEnforceIf(e)
+            
+            self.Add(self.is_use_truck[j] == 0).OnlyEnforceIf(e)
+            
+            self.Add(sum(is_put_to_truck) != 0).OnlyEnforceIf(e.Not())
+            
+            self.Add(self.is_use_truck[j] == 1).OnlyEnforceIf(e.Not())
+
+    def __objective(self) -> None: # Objective function: minimize the total cost
+        
+        self.cost = sum(self.is_use_truck[j] * self.trucks[j][2] for j in range(self.n_trucks))
+        # valid cut: lets the solver prove optimality once an incumbent meets the bound
+        self.Add(self.cost >= self.lower_bound)
+        if self.hint is not None:
+            # only solutions at least as good as the hint are of interest
+            self.Add(self.cost <= self.hint.cost())
+        self.Minimize(self.cost)
+
+    def __add_hint(self) -> None:
+        used = set(self.hint.used_trucks().tolist())
+        for j in range(self.n_trucks):
+            self.AddHint(self.is_use_truck[j], int(j in used))
+        for i, (truck, rotated, x, y) in enumerate(zip(self.hint.truck.tolist(), self.hint.rotated.tolist(),
+                                                       self.hint.x.tolist(), self.hint.y.tolist())):
+            self.AddHint(self.truck_index[i], truck)
+            self.AddHint(self.rotate[i], int(rotated))
+            self.AddHint(self.left[i], x)
+            self.AddHint(self.bottom[i], y)
+
+    def _solution_from(self, value) -> Solution:
+        '''build the solution from value(variable), of the solver or of a solution callback'''
+        solution = Solution(self.instance)
+        for i in range(self.n_rectangles):
+            solution.place(i,
+                           truck=value(self.truck_index[i]),
+                           rotated=value(self.rotate[i]),
+                           x=value(self.left[i]),
+                           y=value(self.bottom[i]))
+        return solution
+
+    def __extract_solution(self) -> Solution:
+        return self._solution_from(self.solver.Value)
+
+    def __print_solution(self) -> None:
+        print('-------------------- SOLUTION --------------------')
+        if not self.silent:
+            print('THE SOLUTION FOUND:')
+            print(format_solution(self.solution))
+
+        print(f'NUMBER OF TRUCKS USED: {len(self.solution.used_trucks())}')
+
+        print(f'COST: {self.solver.ObjectiveValue()}')
+        print_gap(self.solver.ObjectiveValue(), self.lower_bound)
+
+        print('-------------------- OTHER STATS --------------------')
+        print(f'Status   : {self.solver.StatusName(self.status)}')
+        #print(f'Initial conflicts: {self.solver.NumConflicts()}')
+        print(f'Explored branches : {self.solver.NumBranches()}')
+        print(f'Running time: {self.solver.UserTime()} seconds')
+
+    def build(self) -> None:
+        '''read the instance and build the model, solve() does it if not done yet'''
+        with self.perf.phase('parse'):
+            self.__read_input()
+        with self.perf.phase('preprocess'):
+            self.__preprocess()
+        with self.perf.phase('build'):
+            self.__set_variables_and_constraints()
+            self.__objective()
+            if self.hint is not None:
+                self.__add_hint()
+        self.built = True
+
+    def solve(self) -> None:
+        if not getattr(self, 'built', False):
+            self.build()
+        with self.perf.phase('search'):
+            self.status = self.solver.Solve(self, _SolutionPublisher(self) if self.on_solution else None)
+        self.perf.count('search_branches', self.solver.NumBranches())
+        self.perf.count('search_conflicts', self.solver.NumConflicts())
+
+        with self.perf.phase('output'):
+            if self.status == cp_model.OPTIMAL or self.status == cp_model.FEASIBLE:
+                self.solution = self.__extract_solution()
+                self.__print_solution()
+            else:
+                print('NO SOLUTION FOUND.')
+        self.perf.report()
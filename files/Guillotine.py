@@ -1,7 +1,22 @@
+import argparse
 import typing
+from bisect import bisect_left
 from functools import reduce
+from itertools import chain
 from collections import namedtuple
-from sortedcontainers import SortedListWithKey 
+
+from instance import Instance, Solution
+from local_search import improve, print_improvement
+from lower_bound import lower_bound, print_gap
+from perf import PerfCounters
+from solution_io import write_solution
+
+
+#per-phase timings and counters of the run
+PERF = PerfCounters()
+
+#the scoring heuristics, the first one is the default
+SCORES = ['BAF', 'BSSF', 'BLSF', 'WAF', 'WSSF', 'WLSF']
 
 
 #-------------------------------- ITEM CLASS --------------------------------------
@@ -13,22 +28,26 @@ class FreeRectangle(typing.NamedTuple('FreeRectangle', [('width', int), ('height
 
 class Item:
     """
-    Items class for rectangles inserted into sheets
+    Items class for rectangles inserted into sheets,
+    index is the index of the rectangle in the instance
     """
+    __slots__ = ('width', 'height', 'x', 'y', 'area', 'rotated', 'index')
+
     def __init__(self, width, height,
                  CornerPoint: tuple = (0, 0),
-                 rotation: bool = True) -> None:
+                 rotation: bool = True,
+                 index: int = -1) -> None:
         self.width = width
         self.height = height
         self.x = CornerPoint[0]
         self.y = CornerPoint[1]
         self.area = self.width * self.height
         self.rotated = False
-        self.id = id
+        self.index = index
 
 
     def __repr__(self):
-        return 'Item(width=%r, height=%r, x=%r, y=%r)' % (self.width, self.height, self.x, self.y, self.id)
+        return 'Item(width=%r, height=%r, x=%r, y=%r, index=%r)' % (self.width, self.height, self.x, self.y, self.index)
 
 
     def rotate(self) -> None:
@@ -39,19 +58,21 @@ class Item:
 
 #--------------------------------- MISC --------------------------------------- 
 def read_input(file_path):
-    with open(file_path) as f:
-        rect_count, truck_count = map(int, f.readline().split())
-        rects, trucks = list(), list()
-        totalarea=0
-        for _ in range(rect_count):
-            width,height=map(int, f.readline().split())
-            rects.append(Item(width,height))
-            totalarea+=width*height
-
-        for _ in range(truck_count):
-            trucks.append(tuple(map(int, f.readline().split())))
-
-    return rect_count, truck_count, rects, trucks, totalarea
+    instance = Instance.from_file(file_path)
+    rects = [Item(width, height, index=index) for index, (width, height) in enumerate(instance.rect_list())]
+    totalarea = int(instance.areas.sum())
+    return instance, rects, totalarea
+
+def to_solution(instance, rects, truck_ids, rect_in_truck_no):
+    '''
+    build the solution from the pack list of guillotine(),
+    truck_ids maps the position of a truck in the sorted trucks to its index in the instance
+    '''
+    solution = Solution(instance)
+    for rect_id, truck_no in rect_in_truck_no:
+        item = rects[rect_id]
+        solution.place(item.index, truck_ids[truck_no], item.rotated, item.x, item.y)
+    return solution
 
 def fee_per_area(truck):
     '''return fee per area of the truck'''
@@ -60,19 +81,94 @@ def fee_per_area(truck):
 def area(rect:Item):
     return rect.width*rect.height
 
-#optimizing new bin insert by only inserting bins with min(|bin_area - remaining_area|)
-def best_score_remaining_area(remaining_area, trucks):
-    best_score = trucks[0][0]*trucks[0][1]-remaining_area
-    best_id = 0 
-    for i in range(1,len(trucks)):
-        tmp= trucks[i][0]*trucks[i][1]-remaining_area
-        if best_score > tmp: 
-            best_id = i
-            best_score = tmp
-        elif best_score == tmp: 
-            if trucks[i][2] > trucks[best_id][2]: best_id=i
-    
-    return best_id
+#--------------------------------- TRUCK CATALOG --------------------------------------- 
+class TruckCatalog:
+    """
+    Trucks precomputed by area and by cost, to open a new bin in O(log T) while skipping used trucks:
+        by area: sorted areas for bisect, and a segment tree of the min (cost, area rank) of unused trucks
+        by cost: trucks is sorted by fee per area, with a next-unused pointer (compressed on lookup)
+    """
+    def __init__(self, trucks) -> None:
+        self.trucks = trucks
+        #positions of the trucks in trucks, sorted by area then by cost, and the rank of each truck
+        self.order = sorted(range(len(trucks)), key=lambda i: (trucks[i][0]*trucks[i][1], trucks[i][2]))
+        self.rank = [0] * len(trucks)
+        for k, i in enumerate(self.order): self.rank[i] = k
+        self.areas = [trucks[i][0]*trucks[i][1] for i in self.order]
+
+        #leaves at [size, 2*size), used and empty leaves are (inf, k)
+        self.size = 1
+        while self.size < max(len(trucks), 1): self.size *= 2
+        self.min_cost = [(float('inf'), 0)] * (2 * self.size)
+        for k, i in enumerate(self.order): self.min_cost[self.size + k] = (trucks[i][2], k)
+        for node in range(self.size - 1, 0, -1):
+            self.min_cost[node] = min(self.min_cost[2 * node], self.min_cost[2 * node + 1])
+
+        #next_free[i]: first unused position at or after i in trucks, len(trucks) if none
+        self.next_free = list(range(len(trucks) + 1))
+
+    def _cheapest_from(self, k):
+        """(cost, rank) of the cheapest unused truck with area rank >= k"""
+        best = (float('inf'), 0)
+        lo, hi = k + self.size, 2 * self.size
+        while lo < hi:
+            if lo & 1: best = min(best, self.min_cost[lo]); lo += 1
+            if hi & 1: hi -= 1; best = min(best, self.min_cost[hi])
+            lo //= 2; hi //= 2
+        return best
+
+    def _find_next(self, i):
+        root = i
+        while self.next_free[root] != root: root = self.next_free[root]
+        while self.next_free[i] != root: self.next_free[i], i = root, self.next_free[i]
+        return root
+
+    def _set_leaf(self, k, value) -> None:
+        """set the (cost, rank) of the truck of area rank k, and update the min of its ancestors"""
+        node = self.size + k
+        self.min_cost[node] = value
+        node //= 2
+        while node:
+            self.min_cost[node] = min(self.min_cost[2 * node], self.min_cost[2 * node + 1])
+            node //= 2
+
+    def use(self, i) -> None:
+        """mark the truck at position i in trucks as used"""
+        self._set_leaf(self.rank[i], (float('inf'), self.rank[i]))
+        self.next_free[i] = i + 1
+
+    def best_truck(self, remaining_area, item: Item):
+        """
+        return the position in trucks of the truck to open for the item, and mark it as used:
+            the cheapest unused truck with area >= remaining_area that can hold the item, which may hold every item left,
+            else the unused truck with the best fee per area that can hold the item,
+            None if no unused truck can hold the item
+        """
+        #walk the candidates by cost: the ones with the wrong sides are masked, then put back
+        start = bisect_left(self.areas, remaining_area)
+        skipped = []
+        cost, k = self._cheapest_from(start)
+        while cost != float('inf') and not truck_holds(self.trucks[self.order[k]], item):
+            skipped.append((cost, k))
+            self._set_leaf(k, (float('inf'), k))
+            cost, k = self._cheapest_from(start)
+        for leaf in skipped: self._set_leaf(leaf[1], leaf)
+        if cost != float('inf'):
+            self.use(self.order[k])
+            return self.order[k]
+
+        i = self._find_next(0)
+        while i < len(self.trucks):
+            if truck_holds(self.trucks[i], item):
+                self.use(i)
+                return i
+            i = self._find_next(i + 1)
+        return None
+
+
+def truck_holds(truck, item: Item):
+    """check if the empty truck can hold the item, in any orientation"""
+    return (item.width <= truck[0] and item.height <= truck[1]) or (item.height <= truck[0] and item.width <= truck[1])
 
 
 
@@ -258,94 +354,132 @@ def rectangle_merge(freerects):
 
 
 #-------------------------------------- GUILLOTINE MAIN -------------------------------------
-def guillotine(rect_count, truck_count, rects, trucks,remaining_area,score:str="BAF"):
+def guillotine(rect_count, truck_count, rects, trucks,remaining_area,score:str="BAF",verbose:bool=False):
     
     #init counters
     rect_id=0 
-    id = 0
     
     #save id of the bin item i was put in
     rect_in_truck_no=[]
+
+    #trucks by area, a new truck is the one closest to the area of the items left
+    catalog = TruckCatalog(trucks)
     
-    #init free_rects  list
-    free_rects = []
-    free_rects.append(FreeRectangle(trucks[id][0],trucks[id][1],0,0,id))
+    #init free rects, by position in trucks of the open truck they are in,
+    #so a cut only merges the free rects of its own truck, and full trucks drop out of the search
+    free_rects = {}
+    free_count = 0
     
-    #init cost
-    cost = trucks[id][2]
+    #init cost and number of trucks opened
+    cost = 0
+    trucks_used = 0
 
     while rect_id<rect_count:
-        no_fit = False
-
+        item = rects[rect_id]
         
         #find best free rect to put item in 
-        _, best_rect, rotated = find_best_score(rects[rect_id],free_rects,score="BAF")
-        #performing a free rect cut
-        free_rects+=split_rect(best_rect, rects[rect_id],rotated)
-
-        #check if there's no free rects suitable to pack the current item
-        if best_rect == None: no_fit=True
-
-        free_rects = rectangle_merge(free_rects)
-
-        #debug
-        print("CURRENT ITEM SIZE: width (%r) height (%r)" %(rects[rect_id].width,rects[rect_id].height) )
-        print("BEST_RECT_IS:", best_rect)
-        print("LIST OF FREE RECTS at step:", rect_id)
-        for rect in free_rects: print(rect)
-
-        free_rects.remove(best_rect)
-        
-        print()
-        print()
-
-        print("LIST OF FREE RECTS AT STEP (%r) after remove best_rect: " % (rect_id) )
-        for rect in free_rects: print(rect)
-
-        print()
-        print()
+        _, best_rect, rotated = find_best_score(item,chain.from_iterable(free_rects.values()),score=score)
+        PERF.count('score_evaluations', free_count)
+
+        #add new bin if there's no free rects suitable to pack the current item, then retry
+        if best_rect == None:
+            truck_no = catalog.best_truck(remaining_area, item)
+            if truck_no is None:
+                raise ValueError(f'no truck left to hold {item}')
+            cost += trucks[truck_no][2]
+            trucks_used += 1
+            PERF.count('bins_opened')
+            free_rects[truck_no] = [FreeRectangle(trucks[truck_no][0],trucks[truck_no][1],0,0,truck_no)]
+            free_count += 1
+            continue
 
-       
+        #performing a free rect cut, in the truck of the free rect
+        truck_rects = free_rects[best_rect.id]
+        free_count -= len(truck_rects)
+        truck_rects.remove(best_rect)
+        truck_rects+=split_rect(best_rect, item,rotated)
+        item.x, item.y = best_rect.x, best_rect.y
+        truck_rects = rectangle_merge(truck_rects)
+        if truck_rects:
+            free_rects[best_rect.id] = truck_rects
+            free_count += len(truck_rects)
+        else:
+            del free_rects[best_rect.id]
+        remaining_area -= item.area
+        PERF.sample('free_rects', free_count)
 
         #keeping track of which bin is containing which item
-        rect_in_truck_no.append((rect_id,id))   
+        rect_in_truck_no.append((rect_id,best_rect.id))
         rect_id+=1
 
-        print("ITEM's pack list:" )
-        for i in rect_in_truck_no:
-            print("rect (%d) is in bin (%d)" %(i[0],i[1]))
-
-        print()
-        print()
-        
-        #add new bin if cannot fit the rect 
-        if no_fit == True:
-            cost+=trucks[id][2]
-            id += 1 
-            free_rects.append(FreeRectangle(trucks[id][0],trucks[id][1],0,0,id))
-            continue
+        #debug
+        if verbose:
+            print("CURRENT ITEM SIZE: width (%r) height (%r)" %(item.width,item.height) )
+            print("BEST_RECT_IS:", best_rect)
+            print("LIST OF FREE RECTS AT STEP (%r) after remove best_rect: " % (rect_id) )
+            for rect in chain.from_iterable(free_rects.values()): print(rect)
+            print()
     
-    id+=1
-    print("TRUCKS USED: ",id)
+    print("TRUCKS USED: ",trucks_used)
     print("COST NEEDED TO PACK: ",cost)
+    return rect_in_truck_no
             
 
-if __name__ == '__main__':
-    
-    file_path = './generated_data/0006.txt'
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='guillotine heuristic',
+                                     epilog='BAF: Best Area Fit, BSSF: Best Shortside Fit, BLSF: Best Longside fit, '
+                                            'WAF: Worst Area Fit, WSSF: Worst Shortside Fit, WLSF: Worst Longside Fit')
+    parser.add_argument('file_path')
+    parser.add_argument('score', nargs='?', type=str.upper, choices=SCORES, default=SCORES[0],
+                        help='scoring heuristic')
+    parser.add_argument('--output', help='write the solution, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Solution:
+    args = parse_args(argv)
+    scoring_heuristic = args.score
 
     #limit the time taken per iteration to reduce runtime at the cost of maybe skipped a better optimized solution
     GLOBAL_TIME_LIMIT_PER_ITER = 0.1
-    rect_count, truck_count, rects, trucks, total_area = read_input(file_path)
+    #time limit of the local search run after the guillotine pass, in seconds
+    LOCAL_SEARCH_TIME_LIMIT = 1.0
+
+    PERF.switch('parse')
+    instance, rects, total_area = read_input(args.file_path)
+    rect_count, truck_count = instance.rect_count, instance.truck_count
 
+    PERF.switch('preprocess')
     # rects: sort them by area in descending order
     rects.sort(key=area, reverse=True)
 
     # trucks: sort them by fee per area in ascending order
-    trucks.sort(key=fee_per_area)
+    # truck_ids: index of each truck in the instance
+    truck_ids = instance.truck_order().tolist()
+    trucks = instance.truck_list(truck_ids)
+    bound = lower_bound(instance.rect_list(), trucks)
+
+    PERF.switch('search')
+    rect_in_truck_no = guillotine(rect_count,truck_count,rects,trucks,total_area,score=scoring_heuristic)
+    solution = to_solution(instance, rects, truck_ids, rect_in_truck_no)
+
+    #try to empty the trucks opened late, and to swap trucks for cheaper ones
+    PERF.switch('improve')
+    local_search_stats = improve(solution, time_limit=LOCAL_SEARCH_TIME_LIMIT, bound=bound)
+
+    PERF.switch('output')
+    print_improvement(local_search_stats)
+    print(f'NUMBER OF TRUCKS USED: {len(solution.used_trucks())}')
+    print(f'COST: {solution.cost()}')
+    print_gap(solution.cost(), bound)
+    #machine-readable solution, .csv, .jsonl or .npz
+    if args.output is not None:
+        write_solution(solution, args.output)
+    PERF.switch()
+    PERF.report()
+    return solution
 
-    print('CHOOSE scoring heuristic: [ BAF | BSSF | BLSF | WAF | WSSF | WLSF ] \nBAF: Best Area Fit \nBSSF: Best Shortside Fit \nBLSF: Best Longside fit \nWAF: Worst Area Fit \nWSSF: Worst Shortside Fit \nWLSF: Worst Longside Fit')
-    scoring_heuristic = input()
 
-    
-    guillotine(rect_count,truck_count,rects,trucks,total_area)
\ No newline at end of file
+if __name__ == '__main__':
+    #the solution is left in the globals of the script, where service.run_solver reads it
+    solution = main()
\ No newline at end of file
@@ -1,32 +1,35 @@
-from ortools.linear_solver.pywraplp import Solver
-import sys
+import argparse
 import time
 
-def input(file_path):   # import the input from filepath
-    with open(file_path) as f:
-        n_rectangles, n_trucks = [int(x) for x in f.readline().split()]
-        rectangles, trucks = [], []
-
-        for _ in range(n_rectangles):
-            rectangles.append([int(x) for x in f.readline().split()])
-
-        for _ in range(n_trucks):
-            trucks.append([int(x) for x in f.readline().split()])
-
-    return n_rectangles, n_trucks, rectangles, trucks
-
-
-if __name__ == "__main__":
-    try:
-        file_path = sys.argv[1]
-    except IndexError:
-        file_path = 'files/generated_data/0045.txt'
-    n_rectangles, n_trucks, rectangles, trucks = input(file_path)
-    max_width, max_height = (
-        max(trucks, key=lambda x: x[0])[0],
-        max(trucks, key=lambda x: x[1])[1],
-    )
-    
+from instance import Instance, Solution
+from lower_bound import lower_bound, print_gap
+from perf import PerfCounters
+from solution_io import format_solution, write_solution
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='MIP model (SCIP) of the 2D truck packing problem')
+    parser.add_argument('file_path', nargs='?', default='files/generated_data/0045.txt')
+    parser.add_argument('--time-limit', type=float, default=300, help='seconds')
+    parser.add_argument('--silent', action='store_true', help='do not print the placement of every rect')
+    parser.add_argument('--output', help='write the solution, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Solution:
+    args = parse_args(argv)
+    # OR-Tools is only imported past the arguments, --help does not pay for it
+    from ortools.linear_solver.pywraplp import Solver
+    PERF = PerfCounters()
+    PERF.switch('parse')
+    instance = Instance.from_file(args.file_path)
+    PERF.switch('preprocess')
+    n_rectangles, n_trucks = instance.rect_count, instance.truck_count
+    rectangles, trucks = instance.rect_list(), instance.truck_list()
+    max_width, max_height = int(instance.truck_widths.max()), int(instance.truck_heights.max())
+    lb = lower_bound(rectangles, trucks)
+
+    PERF.switch('build')
     solver = Solver.CreateSolver("SCIP")
     start=time.time()
     # truck[i] = 1 if it is used
@@ -152,17 +155,42 @@ if __name__ == "__main__":
 
     # Objective
     cost = sum(truck_used[j] * trucks[j][2] for j in range(n_trucks))
+    # valid cut: lets the solver prove optimality once an incumbent meets the bound
+    Solver.Add(solver, cost >= lb)
     Solver.Minimize(solver, cost)
 
-    solver.set_time_limit(300 * 1000)
+    solver.set_time_limit(int(args.time_limit * 1000))
 
     # Creates solver and solve the model
+    PERF.switch('search')
     status = Solver.Solve(solver)
     end = time.time()
+    PERF.count('search_nodes', solver.nodes())
+    PERF.switch('output')
+    solution = None
     if status == Solver.OPTIMAL or status == Solver.FEASIBLE:
-        
+        solution = Solution(instance)
         for i in range(n_rectangles):
-            print( f"put rectangle {i + 1} with rotation {rotate[i].solution_value()} in truck {truck_index[i].solution_value() + 1} at {left[i].solution_value()} {bottom[i].solution_value()} -> {right[i].solution_value()} {top[i].solution_value()}" )
+            solution.place(i,
+                           truck=round(truck_index[i].solution_value()),
+                           rotated=round(rotate[i].solution_value()),
+                           x=round(left[i].solution_value()),
+                           y=round(bottom[i].solution_value()))
+        if not args.silent:
+            print(format_solution(solution))
+        # machine-readable solution, .csv, .jsonl or .npz
+        if args.output is not None:
+            write_solution(solution, args.output)
         print(f"Min cost: {solver.Objective().Value()}")
-        print("truck_used:", len(set([truck_index[i].solution_value() for i in range(n_rectangles)])))
+        print_gap(solver.Objective().Value(), lb)
+        print("truck_used:", len(solution.used_trucks()))
         print("Running_time: ", end-start)
+
+    PERF.switch()
+    PERF.report()
+    return solution
+
+
+if __name__ == "__main__":
+    # the solution is left in the globals of the script, where service.run_solver reads it
+    solution = main()
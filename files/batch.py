@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from benchmark import FILES_DIR, read_header, select_instances
+from instance import Instance
+from online import pack_instance
+from result_cache import DEFAULT_DIR, DEFAULT_MAX_MB, ResultCache
+from service import PRELOAD, cached_record, run_solver, solution_record
+from solution_io import write_solution
+from verify import solution_from_arrays, verify
+
+
+# run for every instance in the process pool, each one over every instance before the next one:
+# the online packer first, a solution for every instance within milliseconds, then the patterns by item type,
+# then the best-fit heuristics
+HEURISTICS = ['online', 'patterns', 'bestfit_area', 'bestfit_maxside']
+# exact solver, run in a subprocess on the instances small enough, to improve on the heuristics
+EXACT = 'cp'
+
+# seconds an exact run gets past its budget to return its incumbent before it is killed
+KILL_GRACE = 1.0
+
+
+# -------------------------------- RUNS --------------------------------
+def solve_record(solver, file_path, time_limit, cache_dir=None, cache_mb=DEFAULT_MAX_MB) -> dict:
+    '''
+    run the solver in a pool worker, return its record with the solution arrays,
+    with a cache directory, through the result cache, but for the online packer which is faster than the cache
+    '''
+    start = time.perf_counter()
+    if solver == 'online':
+        record = solution_record(pack_instance(Instance.from_file(file_path)))
+    elif cache_dir is not None:
+        record, _ = cached_record(ResultCache(cache_dir, cache_mb), solver, file_path, time_limit)
+    else:
+        solution, _ = run_solver(solver, file_path, time_limit)
+        record = solution_record(solution)
+    record['solver'] = solver
+    record['solve_seconds'] = time.perf_counter() - start
+    return record
+
+
+def run_in_pool(pool, solver, file_path, time_limit, cache=(None, DEFAULT_MAX_MB)) -> asyncio.Future:
+    '''submit a run to the multiprocessing pool, as a future of the running loop'''
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(setter, value):
+        if not future.done():
+            setter(value)
+
+    pool.apply_async(solve_record, (solver, file_path, time_limit) + cache,
+                     callback=lambda record: loop.call_soon_threadsafe(resolve, future.set_result, record),
+                     error_callback=lambda error: loop.call_soon_threadsafe(resolve, future.set_exception, error))
+    return future
+
+
+async def run_in_subprocess(solver, file_path, time_limit, cache=(None, DEFAULT_MAX_MB)) -> dict:
+    '''
+    run the solver in its own process with the time limit, killed KILL_GRACE seconds past it,
+    or as soon as the task is cancelled, return its record
+    '''
+    start = time.perf_counter()
+    cache_dir, cache_mb = cache
+    cache_args = ['--cache', cache_dir, '--cache-mb', str(cache_mb)] if cache_dir is not None else []
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), '--run-one', solver, file_path, str(time_limit), *cache_args,
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), time_limit + KILL_GRACE)
+    except asyncio.TimeoutError:
+        return {'solver': solver, 'status': 'timeout', 'solve_seconds': time.perf_counter() - start}
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode != 0:
+        return {'solver': solver, 'status': 'error', 'solve_seconds': time.perf_counter() - start}
+    return json.loads(output)
+
+
+# -------------------------------- SCHEDULER --------------------------------
+class BatchScheduler:
+    '''
+    solve a batch of instances before a global deadline:
+        every instance gets the heuristics first (process pool), the online packer over the whole batch
+        before any best-fit run, so every instance has a solution early,
+        then the small ones get the exact solver (subprocesses) for a budget of the time left,
+        shared between the unfinished instances in proportion to their number of rects,
+        so the time saved by instances finishing early goes to the others
+    the best solution of every instance is kept as it is found, and returned when the deadline hits,
+    with a cache directory, every run but the online packer goes through the result cache:
+    the heuristics are solved once per instance, the exact solver starts from its best earlier run
+    '''
+
+    def __init__(self, files, deadline, jobs=2, exact_max_rects=40, cache_dir=None, cache_mb=DEFAULT_MAX_MB) -> None:
+        self.files = files
+        self.cache = (cache_dir, cache_mb)
+        self.deadline_seconds = deadline
+        self.jobs = jobs
+        self.exact_max_rects = exact_max_rects
+        self.rect_counts = {file_path: read_header(file_path)[0] for file_path in files}
+        self.instances = dict()
+        self.results = {file_path: {'instance': os.path.basename(file_path),
+                                    'rect_count': self.rect_counts[file_path],
+                                    'status': 'no_solution', 'solver': None, 'cost': None, 'trucks_used': None,
+                                    'found_at': None, 'solution': None, 'runs': list()}
+                        for file_path in files}
+        # weight of the instances still waiting for an exact run
+        self.pending_weight = sum(self.rect_counts[file_path] for file_path in files
+                                  if self.rect_counts[file_path] <= exact_max_rects)
+
+    def time_left(self) -> float:
+        return self.deadline - time.perf_counter()
+
+    def budget(self, file_path) -> float:
+        '''share of the time left of the instance, out of the time left of every exact slot'''
+        weight = self.rect_counts[file_path]
+        share = self.time_left() * self.jobs * weight / max(self.pending_weight, 1)
+        self.pending_weight -= weight
+        return max(0.0, min(share, self.time_left() - KILL_GRACE))
+
+    def record(self, file_path, run) -> None:
+        '''keep the run, and its solution if it is valid and the best of the instance so far'''
+        result = self.results[file_path]
+        if run['status'] == 'ok':
+            if file_path not in self.instances:
+                self.instances[file_path] = Instance.from_file(file_path)
+            if verify(solution_from_arrays(self.instances[file_path], **run['solution']), run['cost']):
+                run['status'] = 'invalid'
+        result['runs'].append({'solver': run['solver'], 'status': run['status'], 'cost': run.get('cost'),
+                               'seconds': round(run.get('solve_seconds', 0.0), 4), 'cache': run.get('cache')})
+        if run['status'] == 'ok' and (result['cost'] is None or run['cost'] < result['cost']):
+            result.update(status='ok', solver=run['solver'], cost=run['cost'], trucks_used=run['trucks_used'],
+                          found_at=round(self.deadline_seconds - self.time_left(), 4), solution=run['solution'])
+
+    async def solve_instance(self, file_path, runs, exact_slots) -> None:
+        for run in asyncio.as_completed(runs):
+            try:
+                self.record(file_path, await run)
+            except Exception as error:
+                self.results[file_path]['runs'].append({'solver': '?', 'status': 'error', 'error': str(error)})
+
+        if self.rect_counts[file_path] > self.exact_max_rects:
+            return
+        async with exact_slots:
+            budget = self.budget(file_path)
+            if budget > 0:
+                self.record(file_path, await run_in_subprocess(EXACT, file_path, budget, self.cache))
+
+    async def run(self) -> dict:
+        '''solve the batch, return the result of every instance once all are done or the deadline hits'''
+        self.deadline = time.perf_counter() + self.deadline_seconds
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(PRELOAD + ['online'])
+        pool = context.Pool(self.jobs)
+        exact_slots = asyncio.Semaphore(self.jobs)
+        # small instances first, they are the ones the exact solver can improve
+        files = sorted(self.files, key=self.rect_counts.get)
+        runs = {file_path: list() for file_path in files}
+        for solver in HEURISTICS:
+            for file_path in files:
+                runs[file_path].append(run_in_pool(pool, solver, file_path, self.time_left(), self.cache))
+        tasks = [asyncio.create_task(self.solve_instance(file_path, runs[file_path], exact_slots))
+                 for file_path in files]
+        try:
+            _, not_done = await asyncio.wait(tasks, timeout=max(self.time_left(), 0))
+            for task in not_done:
+                task.cancel()
+            await asyncio.gather(*not_done, return_exceptions=True)
+        finally:
+            pool.terminate()
+        return self.results
+
+
+def write_solutions(results, instances, directory, extension='.npz') -> None:
+    '''
+    write the best solution of every solved instance with solution_io, to <directory>/<instance name><extension>,
+    and the results, without the solutions, to <directory>/results.json
+    '''
+    os.makedirs(directory, exist_ok=True)
+    for file_path, result in results.items():
+        if result['status'] == 'ok':
+            name = os.path.splitext(result['instance'])[0]
+            write_solution(solution_from_arrays(instances[file_path], **result['solution']),
+                           os.path.join(directory, name + extension))
+    with open(os.path.join(directory, 'results.json'), 'w') as f:
+        json.dump([{key: value for key, value in result.items() if key != 'solution'} for result in results.values()],
+                  f, indent=1)
+
+
+def print_batch(results, seconds) -> None:
+    print(f'{"instance":12} {"rects":>6} {"status":12} {"solver":16} {"cost":>8} {"trucks":>6} {"found at":>9}')
+    for result in sorted(results.values(), key=lambda r: r['rect_count']):
+        print(f'{result["instance"]:12} {result["rect_count"]:6} {result["status"]:12} {str(result["solver"]):16} '
+              f'{str(result["cost"]):>8} {str(result["trucks_used"]):>6} {str(result["found_at"]):>9}')
+    solved = sum(result['status'] == 'ok' for result in results.values())
+    print(f'{solved}/{len(results)} instances solved in {seconds:.2f} s')
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='solve a batch of instances under a global deadline')
+    parser.add_argument('--data', default=os.path.join(FILES_DIR, 'generated_data'), help='directory of the instances')
+    parser.add_argument('--instances', nargs='+', help='instance names, e.g. 0005 0010, instead of a size range')
+    parser.add_argument('--min-rects', type=int, default=0)
+    parser.add_argument('--max-rects', type=int, default=None)
+    parser.add_argument('--deadline', type=float, default=60, help='seconds for the whole batch')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='pool workers and parallel exact runs')
+    parser.add_argument('--exact-max-rects', type=int, default=40, help='largest instance given to the exact solver')
+    parser.add_argument('--output', help='directory of the best solution of every instance, and of results.json')
+    parser.add_argument('--format', choices=['npz', 'csv', 'jsonl'], default='npz', help='format of the solutions')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIR, default=None,
+                        help='directory of the result cache, files/result_cache if no directory is given')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_MAX_MB, help='size of the result cache')
+    parser.add_argument('--run-one', nargs=3, metavar=('SOLVER', 'FILE', 'TIME_LIMIT'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_one:
+        # subprocess side of run_in_subprocess
+        solver, file_path, time_limit = args.run_one
+        print(json.dumps(solve_record(solver, file_path, float(time_limit), args.cache, args.cache_mb)))
+        return 0
+
+    files = select_instances(args.data, args.instances, args.min_rects, args.max_rects)
+    scheduler = BatchScheduler(files, args.deadline, args.jobs, args.exact_max_rects, args.cache, args.cache_mb)
+    start = time.perf_counter()
+    results = asyncio.run(scheduler.run())
+    print_batch(results, time.perf_counter() - start)
+    if args.output:
+        write_solutions(results, scheduler.instances, args.output, f'.{args.format}')
+    return 0 if all(result['status'] == 'ok' for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,364 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from instance import Instance, enable_cache
+from result_cache import DEFAULT_DIR, DEFAULT_MAX_MB, ResultCache, is_optimal, solver_params
+from solution_io import read_solution_file, write_solution
+from verify import verify
+
+
+FILES_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(FILES_DIR)
+
+# solver name -> script and arguments, {file} is replaced by the instance path,
+# {time_limit} by the time limit of the run less EXACT_MARGIN.
+# The order is the one of the columns of final_report.xlsx
+SOLVERS = {
+    'cp': ['CP.py', '{file}', '--time-limit', '{time_limit}'],
+    'mip': ['MIP.py', '{file}', '--time-limit', '{time_limit}'],
+    'bestfit_area': ['bestfit.py', '{file}', '--order', 'area', '--silent'],
+    'bestfit_maxside': ['bestfit.py', '{file}', '--order', 'max_side_length', '--silent'],
+    'guillotine': ['Guillotine.py', '{file}', 'BAF'],
+    'patterns': ['patterns.py', '{file}'],
+    'bestfit_portfolio': ['bestfit.py', '{file}', '--portfolio', '--silent'],
+    'decompose': ['decompose.py', '{file}'],
+}
+
+# the last match in the output wins, e.g. the cost after the local search
+COST_PATTERNS = [re.compile(r'^COST: (\S+)$', re.M), re.compile(r'^Min cost: (\S+)$', re.M)]
+TRUCKS_PATTERNS = [re.compile(r'^NUMBER OF TRUCKS USED: (\d+)$', re.M), re.compile(r'^truck_used: (\d+)$', re.M)]
+
+# seconds the exact solvers stop before the time limit of the run, to write their best solution before the kill
+EXACT_MARGIN = 2.0
+
+# seconds between two samples of the memory of the process group of a run
+RSS_SAMPLE_SECONDS = 0.05
+
+FIELDS = ['solver', 'instance', 'rect_count', 'truck_count', 'status',
+          'cost', 'trucks_used', 'valid', 'wall_time', 'peak_rss_mb', 'returncode', 'cache']
+
+
+# -------------------------------- RUN --------------------------------
+def _last_match(patterns, output):
+    matches = [match for pattern in patterns for match in pattern.finditer(output)]
+    if not matches:
+        return None
+    return max(matches, key=lambda match: match.start()).group(1)
+
+
+def _memory_limiter(memory_limit_mb):
+    def limit_memory():
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return limit_memory
+
+
+def group_rss_mb(pgid) -> float:
+    '''resident memory of the processes of the group, from /proc, in MB'''
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, 'stat')) as f:
+                stat = f.read()
+        except OSError:
+            # the process is gone
+            continue
+        # the fields after the command name, which may hold spaces: state, ppid, pgrp, ..., rss (the 22nd)
+        fields = stat[stat.rindex(')') + 2:].split()
+        if int(fields[2]) == pgid:
+            total += int(fields[21]) * page_size
+    return total / 1024 / 1024
+
+
+def _kill_group(pgid) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def read_header(file_path):
+    '''(rect_count, truck_count) of an instance, from its first line'''
+    with open(file_path) as f:
+        rect_count, truck_count = map(int, f.readline().split())
+    return rect_count, truck_count
+
+
+def cached_run(solver, file_path, outcome, solution, stored) -> dict:
+    '''
+    the record of a run answered by the result cache,
+    wall time and peak RSS are those of the stored run, None if it was not stored by a benchmark
+    '''
+    rect_count, truck_count = read_header(file_path)
+    return {
+        'solver': solver,
+        'instance': os.path.basename(file_path),
+        'rect_count': rect_count,
+        'truck_count': truck_count,
+        'status': 'ok',
+        'cost': float(solution.cost()),
+        'trucks_used': len(solution.used_trucks()),
+        'valid': not verify(solution),
+        'wall_time': stored.get('wall_time'),
+        'peak_rss_mb': stored.get('peak_rss_mb'),
+        'returncode': 0,
+        'cache': outcome,
+    }
+
+
+def run_one(solver, file_path, time_limit, memory_limit_mb=None, cache=None) -> dict:
+    '''
+    run one solver on one instance in its own process group, with the pools of the solver,
+    killed after time_limit seconds, with its address space limited to memory_limit_mb,
+    the peak RSS is that of the whole group, sampled every RSS_SAMPLE_SECONDS, or of the solver process if higher,
+    return the record of the run;
+    with a ResultCache, a run found there is not run again, CP starts from the best solution of its other
+    time limits, and a valid solution is stored
+    '''
+    script, *args = SOLVERS[solver]
+    rect_count, truck_count = read_header(file_path)
+    # every solver writes its solution there, to check it
+    solution_path = os.path.join(tempfile.gettempdir(), f'benchmark_{os.getpid()}_{solver}.npz')
+    solver_limit = f'{max(time_limit - EXACT_MARGIN, 1.0):g}'
+    command = [sys.executable, os.path.join(FILES_DIR, script)] \
+        + [arg.format(file=file_path, time_limit=solver_limit) for arg in args] + ['--output', solution_path]
+
+    outcome = hint_path = None
+    if cache is not None:
+        instance = Instance.from_file(file_path)
+        params = solver_params(solver, SOLVERS[solver], time_limit)
+        outcome, solution, stored = cache.lookup(instance, solver, params)
+        if outcome in ('hit', 'optimal'):
+            return cached_run(solver, file_path, outcome, solution, stored)
+        if outcome == 'warm':
+            hint_path = os.path.join(tempfile.gettempdir(), f'benchmark_{os.getpid()}_{solver}_hint.npz')
+            write_solution(solution, hint_path)
+            command += ['--hint', hint_path]
+
+    with tempfile.TemporaryFile() as output_file:
+        start = time.time()
+        process = subprocess.Popen(command, cwd=ROOT_DIR, stdin=subprocess.DEVNULL,
+                                   stdout=output_file, stderr=subprocess.STDOUT, start_new_session=True,
+                                   preexec_fn=_memory_limiter(memory_limit_mb) if memory_limit_mb else None)
+        killed = threading.Event()
+        done = threading.Event()
+        group_peak_mb = 0.0
+
+        def kill():
+            killed.set()
+            _kill_group(process.pid)
+
+        def sample():
+            nonlocal group_peak_mb
+            while not done.wait(RSS_SAMPLE_SECONDS):
+                group_peak_mb = max(group_peak_mb, group_rss_mb(process.pid))
+
+        timer = threading.Timer(time_limit, kill)
+        timer.start()
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        # wait4 gives the resource usage of this very child, including its peak RSS
+        _, wait_status, usage = os.wait4(process.pid, 0)
+        wall_time = time.time() - start
+        timer.cancel()
+        done.set()
+        sampler.join()
+        # pool workers the solver left behind
+        _kill_group(process.pid)
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+        # ru_maxrss is in KB on Linux
+        peak_rss_mb = round(max(usage.ru_maxrss / 1024, group_peak_mb), 2)
+
+        output_file.seek(0)
+        output = output_file.read().decode(errors='replace')
+
+    cost = _last_match(COST_PATTERNS, output)
+    trucks_used = _last_match(TRUCKS_PATTERNS, output)
+    if killed.is_set():
+        status = 'timeout'
+    elif 'MemoryError' in output or 'bad_alloc' in output:
+        status = 'memory'
+    elif process.returncode != 0:
+        status = 'error'
+    elif cost is None:
+        status = 'no_solution'
+    else:
+        status = 'ok'
+
+    # None when the solver wrote no solution
+    valid = None
+    if os.path.exists(solution_path):
+        if status == 'ok':
+            solution = read_solution_file(Instance.from_file(file_path), solution_path)
+            valid = not verify(solution, cost)
+            if valid and cache is not None:
+                cache.put(solution.instance, solver, params, solution,
+                          {'optimal': is_optimal(output), 'cost': solution.cost(), 'wall_time': round(wall_time, 4),
+                           'peak_rss_mb': peak_rss_mb})
+        os.remove(solution_path)
+    if hint_path is not None:
+        os.remove(hint_path)
+
+    return {
+        'solver': solver,
+        'instance': os.path.basename(file_path),
+        'rect_count': rect_count,
+        'truck_count': truck_count,
+        'status': status,
+        'cost': float(cost) if cost is not None else None,
+        'trucks_used': int(trucks_used) if trucks_used is not None else None,
+        'valid': valid,
+        'wall_time': round(wall_time, 4),
+        'peak_rss_mb': peak_rss_mb,
+        'returncode': process.returncode,
+        'cache': outcome,
+    }
+
+
+def select_instances(data_dir, names=None, min_rects=0, max_rects=None):
+    '''instance files of data_dir, by name (e.g. 0005 or 0005.txt) or by number of rects'''
+    if names:
+        return [os.path.join(data_dir, name if name.endswith('.txt') else f'{name}.txt') for name in names]
+    files = list()
+    for file_path in sorted(glob.glob(os.path.join(data_dir, '*.txt'))):
+        rect_count, _ = read_header(file_path)
+        if rect_count >= min_rects and (max_rects is None or rect_count <= max_rects):
+            files.append(file_path)
+    return files
+
+
+# -------------------------------- OUTPUT --------------------------------
+def write_results(results, prefix) -> None:
+    '''write the runs as prefix.csv and prefix.json, one record per run'''
+    with open(f'{prefix}.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    with open(f'{prefix}.json', 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def write_report(results, file_path) -> None:
+    '''
+    write the comparison table laid out as final_report.xlsx:
+    one row per instance, cost, trucks used and running time of each solver
+    '''
+    solvers = [solver for solver in SOLVERS if any(result['solver'] == solver for result in results)]
+    rows = dict()
+    for result in results:
+        row = rows.setdefault(result['instance'], {'rect_count': result['rect_count'],
+                                                   'truck_count': result['truck_count']})
+        row[f'{result["solver"]}_cost'] = result['cost'] if result['status'] == 'ok' else result['status']
+        row[f'{result["solver"]}_n_car_used'] = result['trucks_used']
+        row[f'{result["solver"]}_running_time'] = result['wall_time']
+
+    fields = ['rect_count', 'truck_count'] + [f'{solver}_{column}' for solver in solvers
+                                              for column in ('cost', 'n_car_used', 'running_time')]
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(row for _, row in sorted(rows.items(), key=lambda item: item[1]['rect_count']))
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=0.5) -> list:
+    '''
+    return the regressions of results against the baseline runs, as messages:
+    a run that stopped succeeding, a higher cost, or a wall time / peak RSS more than tolerance above the baseline
+    (wall times within min_seconds of the baseline are noise)
+    '''
+    baseline = {(run['solver'], run['instance']): run for run in baseline}
+    regressions = list()
+    for run in results:
+        base = baseline.get((run['solver'], run['instance']))
+        if base is None:
+            continue
+        name = f'{run["solver"]} on {run["instance"]}'
+        if base['status'] == 'ok' and run['status'] != 'ok':
+            regressions.append(f'{name}: status {base["status"]} -> {run["status"]}')
+            continue
+        if run['status'] != 'ok':
+            continue
+        if run.get('valid') is False:
+            regressions.append(f'{name}: invalid solution')
+        if base['cost'] is not None and run['cost'] > base['cost']:
+            regressions.append(f'{name}: cost {base["cost"]} -> {run["cost"]}')
+        # a run answered by the cache measured nothing, nor did a baseline run stored by the service or batch
+        if run.get('cache') in ('hit', 'optimal') or base.get('cache') in ('hit', 'optimal'):
+            continue
+        if base['wall_time'] is None or base['peak_rss_mb'] is None:
+            continue
+        if run['wall_time'] > base['wall_time'] * (1 + tolerance) and run['wall_time'] - base['wall_time'] > min_seconds:
+            regressions.append(f'{name}: wall time {base["wall_time"]:.2f} s -> {run["wall_time"]:.2f} s')
+        if run['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f'{name}: peak RSS {base["peak_rss_mb"]} MB -> {run["peak_rss_mb"]} MB')
+    return regressions
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='run the solvers over generated_data and compare them')
+    parser.add_argument('--solvers', nargs='+', choices=list(SOLVERS), default=list(SOLVERS))
+    parser.add_argument('--data', default=os.path.join(FILES_DIR, 'generated_data'), help='directory of the instances')
+    parser.add_argument('--instances', nargs='+', help='instance names, e.g. 0005 0010, instead of a size range')
+    parser.add_argument('--min-rects', type=int, default=0)
+    parser.add_argument('--max-rects', type=int, default=None)
+    parser.add_argument('--time-limit', type=float, default=660, help='seconds per run, the process is killed after')
+    parser.add_argument('--memory-limit', type=int, default=None, help='MB of address space per run')
+    parser.add_argument('--output', default='benchmark', help='prefix of the .csv, .json and _report.csv outputs')
+    parser.add_argument('--baseline', help='json of a previous run to compare against')
+    parser.add_argument('--save-baseline', help='also save this run as a baseline json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative slack before flagging a regression')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIR, default=None,
+                        help='directory of the result cache, files/result_cache if no directory is given')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_MAX_MB, help='size of the result cache')
+    parser.add_argument('--cache-instances', action='store_true',
+                        help='load the instances from .npy caches next to them, written on the first load')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cache_instances:
+        enable_cache()
+    cache = ResultCache(args.cache, args.cache_mb) if args.cache else None
+    results = list()
+    for file_path in select_instances(args.data, args.instances, args.min_rects, args.max_rects):
+        for solver in args.solvers:
+            result = run_one(solver, file_path, args.time_limit, args.memory_limit, cache)
+            print(f'{result["instance"]} {solver:16} {result["status"]:11} cost={result["cost"]} valid={result["valid"]} '
+                  f'trucks={result["trucks_used"]} time={result["wall_time"]}s rss={result["peak_rss_mb"]}MB'
+                  + (f' cache={result["cache"]}' if result['cache'] else ''))
+            results.append(result)
+
+    write_results(results, args.output)
+    write_report(results, f'{args.output}_report.csv')
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        print(f'{len(regressions)} regression(s) against {args.baseline}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
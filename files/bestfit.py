@@ -0,0 +1,503 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from fit_filters import rejected_by
+from instance import Instance, Solution
+from local_search import improve, print_improvement
+from lower_bound import lower_bound, print_gap
+from perf import PerfCounters
+from solution_io import format_solution, write_solution
+from time_budget import TimeBudget
+from truck_index import TruckIndex
+
+
+# per-phase timings and counters of the run
+PERF = PerfCounters()
+
+# orderings of the portfolio mode: (rect sort key, seed of the randomized variant, None for the plain sort)
+ORDERINGS = [('area', None), ('max_side_length', None), ('perimeter', None),
+             ('area', 1), ('max_side_length', 2), ('perimeter', 3)]
+# relative noise on the sort values of the randomized orderings
+ORDER_NOISE = 0.2
+
+
+# -------------------------------- FIT --------------------------------
+def fitable_not_rotated(rect, a, i, j):
+    '''
+    check if the rect fit the truck array a at the coordinate (i, j),
+    without rotating
+    '''
+    if i + rect[0] > a.shape[0] or j + rect[1] > a.shape[1]:
+        return False
+    return not (a[i: i+rect[0], j: j+rect[1]] == 1).any()
+
+
+def fitable_rotated(rect, a, i, j):
+    '''
+    check if the rect fit the truck array a at the coordinate (i, j),
+    rotating = True
+    '''
+    if i + rect[1] > a.shape[0] or j + rect[0] > a.shape[1]:
+        return False
+    return not (a[i: i+rect[1], j: j+rect[0]] == 1).any()
+
+
+def fitable(rect, a, i, j):
+    '''
+    check if the rect fit the truck array a at the coordinate (i, j)
+        return None if not fit,
+        return True if don't need to rotate
+        return False if need to rotate
+    '''
+    if fitable_not_rotated(rect, a, i, j):
+        return True
+    elif fitable_rotated(rect, a, i, j):
+        return False
+    else:
+        return None
+
+
+class FitSearch:
+    '''
+    depth-first search of the placements of rects_to_fit in the truck, on an explicit stack
+    rather than recursion, so that it is paused when its time runs out and resumed later from the same node:
+        depth: number of rects placed, in the order of rects_to_fit
+        cells[d]: next cell (i * truck height + j) to try for the rect d
+        placements[d]: placement (x, y, not_rotated) of the rect d, once placed
+        a: 2d int array of the truck, 1 where occupied, updated in place
+        status: 'paused' until the search ends, then 'found' or 'no_fit'
+    '''
+    __slots__ = ('rects', 'truck', 'a', 'depth', 'cells', 'placements', 'status', 'seconds')
+
+    def __init__(self, rects_to_fit, truck) -> None:
+        self.rects = rects_to_fit
+        self.truck = truck
+        self.a = np.zeros((truck[0], truck[1]), dtype=int)
+        self.depth = 0
+        self.cells = [0] * (len(rects_to_fit) + 1)
+        self.placements = [None] * len(rects_to_fit)
+        self.status = 'paused'
+        # time spent searching, over every run
+        self.seconds = 0.0
+
+    def mark(self, k, value) -> None:
+        '''fill the cells of the rect k at its placement with value'''
+        i, j, not_rotated = self.placements[k]
+        width, height = self.rects[k] if not_rotated else self.rects[k][::-1]
+        self.a[i: i+width, j: j+height] = value
+
+    def run(self, time_limit=float('inf')) -> str:
+        '''search on for at most time_limit seconds, return the status'''
+        start = time.time()
+        cell_count = self.truck[0] * self.truck[1]
+        # counted locally in the loop, added to PERF once per run
+        probes = nodes = 0
+        while self.status == 'paused':
+            # every rect is placed
+            if self.depth == len(self.rects):
+                self.status = 'found'
+                break
+
+            cell = self.cells[self.depth]
+            # every cell was tried for the rect: backtrack, the previous rect moves to its next cell
+            if cell == cell_count:
+                self.cells[self.depth] = 0
+                self.depth -= 1
+                if self.depth < 0:
+                    self.depth = 0
+                    self.status = 'no_fit'
+                    break
+                self.mark(self.depth, 0)
+                continue
+
+            # pause at the time limit, the next run starts from this cell
+            if time.time() - start > time_limit:
+                break
+
+            self.cells[self.depth] += 1
+            probes += 1
+            i, j = divmod(cell, self.truck[1])
+            fitable_var = fitable(self.rects[self.depth], self.a, i, j)
+            if fitable_var is not None:
+                nodes += 1
+                self.placements[self.depth] = (i, j, fitable_var)
+                self.mark(self.depth, 1)
+                self.depth += 1
+                self.cells[self.depth] = 0
+
+        self.seconds += time.time() - start
+        PERF.count('cell_probes', probes)
+        PERF.count('search_nodes', nodes)
+        return self.status
+
+
+def fit(rects_to_fit, truck_to_fit):
+    '''
+    check if all rects in rects_to_fit fit the truck_to_fit, without time limit,
+    return the placements (x, y, not_rotated) of the rects in the order of rects_to_fit if they fit,
+    None otherwise
+    '''
+    search = FitSearch(rects_to_fit, truck_to_fit)
+    return search.placements if search.run() == 'found' else None
+
+
+def resume_searches(paused, budget, rects_left):
+    '''
+    resume the paused searches (truck index, fill ratio, search), the deepest first,
+    each with a new allowance of the budget,
+    return (truck index, placements) of the first that finds a fit, None otherwise
+    '''
+    for index, fill_ratio, search in sorted(paused, key=lambda paused_search: -paused_search[2].depth):
+        if budget.is_exhausted():
+            return None
+        PERF.count('resumed_searches')
+        spent = search.seconds
+        status = search.run(budget.allowance(rects_left, fill_ratio, len(search.rects)))
+        budget.record(fill_ratio, search.seconds - spent, success=status == 'found', timed_out=status == 'paused')
+        if status == 'found':
+            PERF.count('resumed_fits')
+            return index, search.placements
+    return None
+
+
+def fit_free_space(rect, truck, rects_in_truck, placements):
+    '''
+    place the rect in the free space of the truck around the rects already placed there,
+    without moving them: a summed-area table of the occupied cells tests every position at once,
+    return the placement (x, y, not_rotated) of the rect, None if it does not fit
+    '''
+    a = np.zeros((truck[0], truck[1]), dtype=np.int64)
+    for placed, (i, j, not_rotated) in zip(rects_in_truck, placements):
+        width, height = placed if not_rotated else placed[::-1]
+        a[i: i+width, j: j+height] = 1
+    table = np.zeros((truck[0] + 1, truck[1] + 1), dtype=np.int64)
+    table[1:, 1:] = a.cumsum(0).cumsum(1)
+    for not_rotated, (width, height) in ((True, rect), (False, rect[::-1])):
+        if width > truck[0] or height > truck[1]:
+            continue
+        occupied = (table[width:, height:] - table[:-width, height:]
+                    - table[width:, :-height] + table[:-width, :-height])
+        free = np.argwhere(occupied == 0)
+        if len(free):
+            i, j = free[0].tolist()
+            return (i, j, not_rotated)
+    return None
+
+
+# -------------------------------- UTILITIES --------------------------------
+def area(tup):
+    '''return the area of rect or truck, generally called tup (stands for tuple)'''
+    return tup[0] * tup[1]
+
+
+def order_rects(instance: Instance, key='area', seed=None):
+    '''
+    indices of the rects sorted by key in descending order,
+    with a seed, each value is first scaled by a random factor within ORDER_NOISE of 1,
+    so that rects of close values may swap
+    '''
+    if seed is None:
+        return instance.rect_order(key)
+    rng = np.random.default_rng(seed)
+    values = instance.rect_values(key) * rng.uniform(1 - ORDER_NOISE, 1 + ORDER_NOISE, instance.rect_count)
+    return np.argsort(-values, kind='stable')
+
+
+def ordering_name(rect_key, seed) -> str:
+    return rect_key if seed is None else f'{rect_key}~{seed}'
+
+
+# -------------------------------- BEST FIT --------------------------------
+def best_fit(instance: Instance, rect_key='area', truck_key='fee_per_area', budget=60.0, seed=None,
+             audit_filters=False, verbose=False, stats=None) -> Solution:
+    '''
+    put each rect, in the order of rect_key (randomized with a seed), in the first truck, in the order of truck_key,
+    where it fits along with the rects already there; the fit searches share budget seconds (see TimeBudget),
+    past it, the rects left only go to the free space of the trucks.
+    audit_filters still runs the searches the fit filters rejected, to count the timeouts they avoid
+    '''
+    budget = TimeBudget(budget)
+
+    # rects: sorted by rect_key in descending order
+    # rect_ids: index of each rect in the instance
+    rect_ids = order_rects(instance, rect_key, seed).tolist()
+    rects = instance.rect_list(rect_ids)
+
+    # trucks: sorted by truck_key, fee per area in ascending order by default
+    # truck_ids: index of each truck in the instance
+    truck_ids = instance.truck_order(truck_key).tolist()
+    trucks = instance.truck_list(truck_ids)
+
+    if verbose:
+        print('-------------------- SORTED LISTS --------------------')
+        print(rects)
+        print(trucks)
+        print('-------------------- RUN --------------------')
+
+    # area left in each truck
+    areas_left: list[int] = [area(truck) for truck in trucks]
+    # list of rect contained in each truck
+    rects_contained: list[list] = [list() for _ in range(len(trucks))]
+    # instance indices of the rects contained in each truck, and their last found placements
+    rect_ids_contained: list[list] = [list() for _ in range(len(trucks))]
+    placements_contained: list[list] = [list() for _ in range(len(trucks))]
+    # sizes (short side, long side) of the rects the free space of each truck could not hold, while its rects
+    # only get added around the others no larger rect fits either, cleared when a search moves them
+    no_room: list[list] = [list() for _ in range(len(trucks))]
+    # index of the trucks, to only visit the trucks that can possibly hold a rect
+    truck_index = TruckIndex(trucks, areas_left)
+    time_exceeded_count = 0
+
+    for position, (rect, rect_id) in enumerate(zip(rects, rect_ids)):
+        # -------------------------------- TAKE A RECT --------------------------------
+        # number of rects left, this one included
+        rects_left = len(rects) - position
+        if verbose:
+            print(f'Number of rects left: {rects_left}')
+        area_rect = area(rect)
+        size = (min(rect), max(rect))
+
+        # -------------------------------- ITERATE THROUGH TRUCKS --------------------------------
+        # only the trucks with enough area left and long enough sides, in truck_key order,
+        # the audit leaves the sides to the 'sides' fit filter, to count the trucks they rule out
+        # loaded: (truck index, placements of the rects of the truck with the rect) once a truck takes it
+        loaded = None
+        # searches paused at their time limit: (truck index, fill ratio, search)
+        paused = list()
+        for index in truck_index.candidates(rect, area_rect, sides=not audit_filters):
+            truck, rects_contained_in_truck = trucks[index], rects_contained[index]
+            fill_ratio = 1 - areas_left[index] / area(truck)
+            # once the budget is spent, the rect only goes into the free space left around
+            # the rects of the truck, which is immediate
+            if budget.is_exhausted():
+                if any(short <= size[0] and long <= size[1] for short, long in no_room[index]):
+                    continue
+                PERF.count('free_space_calls')
+                placement = fit_free_space(rect, truck, rects_contained_in_truck, placements_contained[index])
+                if placement is not None:
+                    loaded = (index, placements_contained[index] + [placement])
+                    break
+                no_room[index].append(size)
+                continue
+
+            # before opening an empty truck, the paused searches of the loaded trucks get more time
+            if not rects_contained_in_truck and paused:
+                loaded = resume_searches(paused, budget, rects_left)
+                paused = list()
+                if loaded is not None:
+                    break
+
+            # cheap necessary conditions first, the search only runs if none proves the rects do not fit
+            rejection = rejected_by(rects_contained_in_truck+[rect], truck)
+            if rejection is not None:
+                PERF.count(f'rejected_{rejection}')
+                if audit_filters:
+                    # run the search anyway, to count the timeouts the filter avoided, a fit found is a filter bug
+                    audit = FitSearch(rects_contained_in_truck+[rect], truck)
+                    PERF.count(f'audit_{audit.run(budget.allowance(rects_left, fill_ratio, len(audit.rects)))}')
+                continue
+
+            PERF.count('fit_calls')
+            # search the placements of the rect + previous rects currently in the truck, with its share of the budget
+            search = FitSearch(rects_contained_in_truck+[rect], truck)
+            time_limit = budget.allowance(rects_left, fill_ratio, len(search.rects))
+            status = search.run(time_limit)
+            budget.record(fill_ratio, search.seconds, success=status == 'found', timed_out=status == 'paused')
+
+            if status == 'paused':
+                # count the number of times the iteration's running time exceeded limit,
+                # the search is kept to be resumed
+                time_exceeded_count += 1
+                PERF.count('time_exceeded_count')
+                paused.append((index, fill_ratio, search))
+                if verbose:
+                    print(f'#{index} Iteration, #{rects_left} rect: The iteration exceeded {time_limit:.4f} second(s) limit, paused the search')
+                continue
+
+            if status == 'found':
+                loaded = (index, search.placements)
+                # break out of the truck loop
+                break
+
+        if loaded is None and paused:
+            loaded = resume_searches(paused, budget, rects_left)
+
+        if loaded is None:
+            # no truck took the rect in time, so it goes to the free space of the first truck that holds it
+            for index in truck_index.candidates(rect, area_rect):
+                placement = fit_free_space(rect, trucks[index], rects_contained[index], placements_contained[index])
+                if placement is not None:
+                    loaded = (index, placements_contained[index] + [placement])
+                    PERF.count('free_space_fallbacks')
+                    break
+            else:
+                raise ValueError(f'no truck can hold the rect {rect_id} {rect}')
+
+        index, placements = loaded
+        if placements[:-1] != placements_contained[index]:
+            no_room[index].clear()
+        # reduce the area left of the truck
+        areas_left[index] -= area_rect
+        truck_index.update(index, areas_left[index])
+        # add the rect to the list of rects already in the truck
+        rects_contained[index].append(rect)
+        rect_ids_contained[index].append(rect_id)
+        placements_contained[index] = placements
+
+    solution = Solution(instance)
+    for truck_id, rect_ids_in_truck, placements in zip(truck_ids, rect_ids_contained, placements_contained):
+        for rect_id, (x, y, not_rotated) in zip(rect_ids_in_truck, placements):
+            solution.place(rect_id, truck_id, not not_rotated, x, y)
+
+    if stats is not None:
+        stats.update(time_exceeded_count=time_exceeded_count, budget=budget)
+    return solution
+
+
+def solve(instance: Instance, rect_key='area', truck_key='fee_per_area', budget=60.0, seed=None,
+          local_search_time_limit=1.0, bound=None, audit_filters=False, verbose=False, stats=None) -> Solution:
+    '''best fit, then the local search tries to empty the trucks opened late, and to swap trucks for cheaper ones'''
+    solution = best_fit(instance, rect_key, truck_key, budget, seed, audit_filters, verbose, stats)
+    local_search_stats = improve(solution, time_limit=local_search_time_limit, bound=bound)
+    if stats is not None:
+        stats['local_search'] = local_search_stats
+    return solution
+
+
+# -------------------------------- PORTFOLIO --------------------------------
+def _solve_ordering(file_path, rect_key, truck_key, seed, budget, local_search_time_limit, bound):
+    '''run one ordering of the portfolio in a pool worker'''
+    start = time.perf_counter()
+    solution = solve(Instance.from_file(file_path), rect_key, truck_key, budget, seed,
+                     local_search_time_limit, bound)
+    return ordering_name(rect_key, seed), solution, time.perf_counter() - start
+
+
+def solve_portfolio(file_path, orderings=ORDERINGS, truck_key='fee_per_area', budget=60.0,
+                    local_search_time_limit=1.0, bound=None, jobs=None, results=None) -> Solution:
+    '''
+    run the orderings (rect key, seed) concurrently on a process pool, jobs at a time, so each gets
+    the budget (and local search time) divided by the number of rounds, the portfolio ends within them,
+    return the cheapest complete solution,
+    results gets (ordering, cost, seconds) of each run, in the order of the orderings
+    '''
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['numpy', 'bestfit'])
+    jobs = jobs or min(len(orderings), os.cpu_count() or 1)
+    rounds = math.ceil(len(orderings) / jobs)
+    budget, local_search_time_limit = budget / rounds, local_search_time_limit / rounds
+    best = None
+    with context.Pool(jobs) as pool:
+        runs = [pool.apply_async(_solve_ordering, (file_path, rect_key, truck_key, seed, budget,
+                                                   local_search_time_limit, bound))
+                for rect_key, seed in orderings]
+        for run in runs:
+            name, solution, seconds = run.get()
+            if results is not None:
+                results.append((name, solution.cost() if solution.is_complete() else None, seconds))
+            if solution.is_complete() and (best is None or solution.cost() < best.cost()):
+                best = solution
+    return best
+
+
+def print_portfolio(results) -> None:
+    print('-------------------- PORTFOLIO --------------------')
+    print(f'{"ordering":20} {"cost":>10} {"seconds":>9}')
+    for name, cost, seconds in results:
+        print(f'{name:20} {str(cost):>10} {seconds:9.3f}')
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='best-fit heuristic, one ordering of the rects or a portfolio of them')
+    parser.add_argument('file_path', nargs='?', default='files/generated_data/1000.txt')
+    parser.add_argument('--order', choices=['area', 'max_side_length', 'perimeter'], default='area',
+                        help='sort key of the rects, in descending order')
+    parser.add_argument('--trucks', choices=['fee_per_area', 'cost', 'area'], default='fee_per_area',
+                        help='sort key of the trucks')
+    parser.add_argument('--seed', type=int, default=None, help='randomize the order of the rects')
+    parser.add_argument('--budget', type=float, default=60.0, help='total seconds of the fit searches')
+    parser.add_argument('--local-search', type=float, default=1.0, help='seconds of the local search')
+    parser.add_argument('--portfolio', action='store_true',
+                        help='run the orderings of ORDERINGS on a process pool, keep the cheapest, within the budget')
+    parser.add_argument('--jobs', type=int, default=None, help='processes of the portfolio')
+    # removing prints (--silent) possibly result in a lower running time, about from 0.1 to 1 second
+    parser.add_argument('--silent', action='store_true')
+    parser.add_argument('--audit-filters', action='store_true',
+                        help='still run the searches the fit filters rejected, to count the timeouts they avoid')
+    parser.add_argument('--output', help='write the solution, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Solution:
+    args = parse_args(argv)
+
+    PERF.switch('parse')
+    instance = Instance.from_file(args.file_path)
+    PERF.switch('preprocess')
+    # lower bound of the cost, to report the gap of the solution
+    bound = lower_bound(instance.rect_list(), instance.truck_list())
+    if not args.silent:
+        print('-------------------- INPUT --------------------')
+        print(instance.rect_count)
+        print(instance.rect_list())
+        print(instance.truck_count)
+        print(instance.truck_list())
+        print()
+
+    GLOBAL_time_start = time.time()
+    stats = dict()
+    if args.portfolio:
+        print('Running the portfolio...')
+        PERF.switch('portfolio')
+        results = list()
+        solution = solve_portfolio(args.file_path, truck_key=args.trucks, budget=args.budget,
+                                   local_search_time_limit=args.local_search, bound=bound,
+                                   jobs=args.jobs, results=results)
+    else:
+        if args.silent:
+            print('Running...')
+        PERF.switch('search')
+        solution = best_fit(instance, args.order, args.trucks, args.budget, args.seed,
+                            args.audit_filters, verbose=not args.silent, stats=stats)
+        PERF.switch('improve')
+        stats['local_search'] = improve(solution, time_limit=args.local_search, bound=bound)
+
+    # -------------------------------- PRINT SOLUTION --------------------------------
+    GLOBAL_time_end = time.time()
+    PERF.switch('output')
+
+    print('-------------------- SOLUTION --------------------')
+    if not args.silent:
+        print('THE SOLUTION FOUND:')
+        print(format_solution(solution))
+    if args.output is not None:
+        write_solution(solution, args.output)
+    print(f'NUMBER OF TRUCKS USED: {len(solution.used_trucks())}')
+
+    cost = solution.cost()
+    print(f'COST: {cost}')
+    print_gap(cost, bound)
+
+    print('-------------------- OTHER STATS --------------------')
+    print(f'Total running time: {GLOBAL_time_end - GLOBAL_time_start}')
+    if args.portfolio:
+        print_portfolio(results)
+    else:
+        print(f'Ordering: {ordering_name(args.order, args.seed)}, trucks by {args.trucks}')
+        print(f'Number of iterations skipped: {stats["time_exceeded_count"]}')
+        stats['budget'].report()
+        print_improvement(stats['local_search'])
+    PERF.switch()
+    PERF.report()
+    return solution
+
+
+if __name__ == '__main__':
+    # the solution is left in the globals of the script, where service.run_solver reads it
+    solution = main()
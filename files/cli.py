@@ -0,0 +1,139 @@
+import importlib
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+FILES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# backends only some commands need, reported by --timing
+HEAVY_MODULES = ['ortools', 'matplotlib', 'sortedcontainers', 'numpy']
+
+TIMING_PATTERN = re.compile(r'^STARTUP: (\S+) imported in (\S+) s, heavy modules: (.*)$', re.M)
+
+
+# -------------------------------- COMMANDS --------------------------------
+class Command:
+    '''a subcommand, target: the module, imported only when the command runs, whose main(argv) gets the arguments'''
+    __slots__ = ('name', 'target', 'help')
+
+    def __init__(self, name, target, help) -> None:
+        self.name = name
+        self.target = target
+        self.help = help
+
+
+COMMANDS = {command.name: command for command in [
+    Command('cp', 'CP', 'exact CP-SAT model (OR-Tools)'),
+    Command('mip', 'MIP', 'exact MIP model (OR-Tools)'),
+    Command('bestfit', 'bestfit', 'best-fit heuristic, one ordering of the rects or a portfolio of them'),
+    Command('guillotine', 'Guillotine', 'guillotine heuristic'),
+    Command('patterns', 'patterns', 'packing by item types with reusable truck patterns'),
+    Command('online', 'online', 'online packing of a stream of rects'),
+    Command('portfolio', 'portfolio', 'anytime solve: heuristics first, then CP refines the best of them'),
+    Command('incremental', 'incremental', 're-solve a solution with CP after a small change of its instance'),
+    Command('decompose', 'decompose', 'large instances: clusters of rects solved in parallel, then merged'),
+    Command('verify', 'verify', 'check a solution file against its instance'),
+    Command('generate', 'data_generator', 'generate instances'),
+    Command('benchmark', 'benchmark', 'run the solvers over generated_data and compare them'),
+    Command('batch', 'batch', 'solve a batch of instances before a global deadline'),
+    Command('service', 'service', 'solver service over HTTP, and its client'),
+]}
+
+
+def print_usage(file=sys.stdout) -> None:
+    print('usage: cli.py [--timing] [--cache-instances] <command> [arguments of the command]', file=file)
+    print('       cli.py startup [--repeat N] [commands...]', file=file)
+    print(file=file)
+    print('commands:', file=file)
+    for command in COMMANDS.values():
+        print(f'  {command.name:12} {command.help}', file=file)
+    print(f'  {"startup":12} measure the startup of the commands', file=file)
+    print(file=file)
+    print('options:', file=file)
+    print(f'  {"--timing":18} report the import time of the backend of the command', file=file)
+    print(f'  {"--cache-instances":18} load the instances from .npy caches next to them, written on the first load',
+          file=file)
+
+
+def run_command(command, args):
+    '''import the backend of the command and run it, return (exit code, seconds to import the backend)'''
+    start = time.perf_counter()
+    module = importlib.import_module(command.target)
+    import_seconds = time.perf_counter() - start
+    try:
+        code = module.main(args)
+    except SystemExit as exit:
+        code = exit.code
+    # some mains return their solution rather than an exit code
+    return (code if isinstance(code, int) else 0), import_seconds
+
+
+def report_timing(name, import_seconds) -> None:
+    heavy = [module for module in HEAVY_MODULES if module in sys.modules]
+    seconds = '-' if import_seconds is None else f'{import_seconds:.4f}'
+    print(f'STARTUP: {name} imported in {seconds} s, heavy modules: {", ".join(heavy) or "none"}',
+          file=sys.stderr)
+
+
+# -------------------------------- STARTUP --------------------------------
+def measure_startup(args) -> int:
+    '''
+    run `cli.py --timing <command> --help` of each command in a fresh interpreter, repeat times,
+    and print the best wall time, the time to import the backend and the heavy modules it loaded
+    '''
+    repeat = 3
+    if args[:1] == ['--repeat']:
+        repeat, args = int(args[1]), args[2:]
+    names = args or list(COMMANDS)
+    print(f'{"command":12} {"wall (s)":>9} {"import (s)":>11}  heavy modules')
+    for name in [None] + names:
+        command_args = ['--help'] if name is None else ['--timing', name, '--help']
+        wall = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run = subprocess.run([sys.executable, os.path.join(FILES_DIR, 'cli.py')] + command_args,
+                                 capture_output=True, text=True)
+            wall = min(wall, time.perf_counter() - start)
+        match = TIMING_PATTERN.search(run.stderr)
+        import_seconds, heavy = (match.group(2), match.group(3)) if match else ('-', 'none')
+        print(f'{name or "(--help)":12} {wall:9.3f} {import_seconds:>11}  {heavy}')
+    return 0
+
+
+# -------------------------------- MAIN --------------------------------
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    options = set()
+    while argv[:1] in (['--timing'], ['--cache-instances']):
+        options.add(argv[0])
+        argv = argv[1:]
+    timing = '--timing' in options
+    if '--cache-instances' in options:
+        # set in the environment, rather than imported from instance, so --help stays free of numpy
+        os.environ['INSTANCE_CACHE'] = '1'
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+
+    name, args = argv[0], argv[1:]
+    if name == 'startup':
+        return measure_startup(args)
+    if name not in COMMANDS:
+        print(f'unknown command: {name}', file=sys.stderr)
+        print_usage(sys.stderr)
+        return 2
+
+    import_seconds = None
+    try:
+        code, import_seconds = run_command(COMMANDS[name], args)
+    finally:
+        if timing:
+            report_timing(name, import_seconds)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
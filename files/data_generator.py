@@ -1,13 +1,19 @@
 from math import ceil
 import random as rd
-from copy import Error, deepcopy
-import sys
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import argparse
+import os
+import tempfile
+import time
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 
+# matplotlib is only imported when figures are requested
 def plot_full_truck_and_cut_truck(truck_array, removed_array, shape, len_trucks):
+    import matplotlib.pyplot as plt
     plt.plot([0, shape[1], shape[1]], [shape[0], shape[0], 0], 'red')
     plt.imshow(truck_array, cmap='turbo', extent=(0,25,25,0), vmin=-1, vmax=5)
     plt.savefig(f'files/generated_figures/{len_trucks}_A')
@@ -19,6 +25,7 @@ def plot_full_truck_and_cut_truck(truck_array, removed_array, shape, len_trucks)
 
 
 def plot_building_solution(truck_array, available_places):
+    import matplotlib.pyplot as plt
     plt.imshow(truck_array, cmap='turbo', extent=(0,25,25,0), vmin=-1, vmax=5)
     for place in available_places:
         plt.text(place[1]+0.5, place[0], 'x', ha='center', va='top', c='white')
@@ -133,64 +140,266 @@ def rd_truck_size():
     return rd.randrange(1, 26), rd.randrange(1, 26)
 
 
+def generate_legacy(rect_count, file_path, save_figures=False):
+    '''
+    generate an instance with the global random state, as the files in generated_data were made:
+    reproduces them when called in order after rd.seed(69420)
+    '''
+    # create rects randomly
+    rects = rd_some_rects(rect_count)
+
+    # create trucks with rects
+    copy_rects = deepcopy(rects)  # save to recover later
+    trucks = list()  # list of tuples of size, cost not included
+
+    while rects:
+        # save figures of: BUILD 6TH truck OF DIFFICULTY 5
+        rects, picked_rects = rd_pick_some_rects(rects)
+        truck_array = rd_put(picked_rects,
+                           save_figures=save_figures and len(trucks)==5)
+        shape = shape_after_remove_redundant(truck_array)
+        trucks.append(shape)
+
+        # save figures of: all trucks of difficulty 5
+        if save_figures:
+            plot_full_truck_and_cut_truck(truck_array, remove_redundant(truck_array, shape), shape, len(trucks))
+
+    trucks += [rd_truck_size() for _ in range(ceil(len(trucks)/5))]
+
+    rects = copy_rects
+
+    # write to files
+    with atomic_write(file_path) as f:
+        f.write(f'{rect_count} {len(trucks)}\n')
+        for rect in rects:
+            f.write(f'{rect[0]} {rect[1]}\n')
+        for truck in trucks:
+            f.write(f'{truck[0]} {truck[1]} {rd_truck_cost()}\n')
+
+
+@contextmanager
+def atomic_write(file_path):
+    '''write to a temporary file next to file_path, renamed over it only once complete'''
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            yield f
+        # mkstemp creates the file as 0600, give it the mode open() would have
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# -------------------------------- FAST GENERATOR --------------------------------
+# same process and output format as above, with a private random state and linear time:
+#   rects are picked by consuming a random permutation, not by shuffling the rects left,
+#   available places are kept in a RandomPool, not in a list searched and shuffled,
+#   trucks are streamed to disk while generated
+TRUCK_MAX_SIZE = 25
+
+
+class RandomPool:
+    '''set with O(1) add, discard and random pop, the popped item is swapped with the last one'''
+    __slots__ = ('items', 'positions')
+
+    def __init__(self, items=()) -> None:
+        self.items = list()
+        self.positions = dict()
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, item) -> None:
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item) -> None:
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def pop_random(self, rng):
+        item = self.items[rng.randrange(len(self.items))]
+        self.discard(item)
+        return item
+
+
+def fast_put(rects, rng) -> tuple[int, int]:
+    '''
+    randomly put each rectangle next to each other, as rd_put does,
+    return the size of the truck, i.e. the bounding box of the rects
+    '''
+    occupied = np.zeros((TRUCK_MAX_SIZE, TRUCK_MAX_SIZE), dtype=bool)
+    available_places = RandomPool([(0, 0)])
+    width = height = 0
+
+    for rect in rects:
+        while True:
+            # pick a random place to put, it is dropped even if not puttable, as in rd_put
+            x_start, y_start = available_places.pop_random(rng)
+            x_end, y_end = x_start + rect[0], y_start + rect[1]
+
+            # only put if puttable
+            if x_end <= TRUCK_MAX_SIZE and y_end <= TRUCK_MAX_SIZE \
+                    and not occupied[x_start: x_end, y_start: y_end].any():
+                occupied[x_start: x_end, y_start: y_end] = True
+                break
+
+        # remove old places, add new places
+        for x in range(x_start, x_end):
+            for y in range(y_start, y_end):
+                available_places.discard((x, y))
+        for y in range(y_start, y_end):
+            available_places.add((x_end, y))
+        for x in range(x_start, x_end):
+            available_places.add((x, y_end))
+
+        width, height = max(width, x_end), max(height, y_end)
+
+    return width, height
+
+
+def generate_fast(rect_count, file_path, seed):
+    '''
+    generate an instance in linear time, seeded by seed,
+    return the number of trucks
+    '''
+    rng = rd.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    # rect sizes from 1 to 5 each side, as rd_a_rect
+    rects = np_rng.integers(1, 6, size=(rect_count, 2), dtype=np.int8)
+    # picking some rects left at random = taking the next ones of a random permutation
+    order = np_rng.permutation(rect_count)
+
+    directory = os.path.dirname(file_path) or '.'
+    with tempfile.TemporaryFile('w+', dir=directory) as trucks_file:
+        truck_count = 0
+        start = 0
+        while start < rect_count:
+            picked = order[start: start + rng.randrange(2, 6)]
+            start += len(picked)
+            width, height = fast_put(rects[picked].tolist(), rng)
+            trucks_file.write(f'{width} {height} {rng.randrange(100, 1001, 50)}\n')
+            truck_count += 1
+
+        # extra random trucks, as rd_truck_size
+        extra_count = ceil(truck_count / 5)
+        for _ in range(extra_count):
+            trucks_file.write(f'{rng.randrange(1, TRUCK_MAX_SIZE + 1)} {rng.randrange(1, TRUCK_MAX_SIZE + 1)} '
+                              f'{rng.randrange(100, 1001, 50)}\n')
+        truck_count += extra_count
+
+        # header and rects, then the trucks streamed back from the temporary file
+        trucks_file.seek(0)
+        with atomic_write(file_path) as f:
+            f.write(f'{rect_count} {truck_count}\n')
+            np.savetxt(f, rects, fmt='%d')
+            while chunk := trucks_file.read(1 << 20):
+                f.write(chunk)
+
+    return truck_count
+
+
+# -------------------------------- CORPUS --------------------------------
+# numbers of rectangles based on difficulty (index)
+RECT_COUNTS = [i for i in range(5, 55)] + \
+              [i for i in range(60, 331, 30)] + \
+              [i for i in range(350, 1000, 50)] +\
+              [i for i in range(1000, 5001, 1000)]
+
+LEGACY_SEED = 69420
 
 
+def instance_seed(seed, rect_count, copy_index) -> int:
+    '''independent seed of one instance, derived from the corpus seed, its number of rects and its copy index'''
+    state = np.random.SeedSequence(seed, spawn_key=(rect_count, copy_index)).generate_state(2)
+    return int(state[0]) << 32 | int(state[1])
+
+
+def instance_path(directory, rect_count, copy_index) -> str:
+    name = str(rect_count).zfill(4) if copy_index == 0 else f'{str(rect_count).zfill(4)}_{copy_index}'
+    return f'{directory}/{name}.txt'
+
+
+def _generate_job(job):
+    rect_count, file_path, seed = job
+    start = time.time()
+    truck_count = generate_fast(rect_count, file_path, seed)
+    return file_path, rect_count, truck_count, time.time() - start
+
+
+def generate_corpus(rect_counts, directory, seed, copies=1, jobs=None, overwrite=False):
+    '''
+    generate copies instances of each number of rects over a process pool,
+    each instance with its own seed so it can be regenerated alone,
+    existing files are kept unless overwrite
+    '''
+    todo = list()
+    for rect_count in rect_counts:
+        for copy_index in range(copies):
+            file_path = instance_path(directory, rect_count, copy_index)
+            if overwrite or not os.path.exists(file_path):
+                todo.append((rect_count, file_path, instance_seed(seed, rect_count, copy_index)))
+
+    # biggest first, so the pool is not left waiting on one big instance at the end
+    todo.sort(key=lambda job: -job[0])
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for file_path, rect_count, truck_count, seconds in pool.map(_generate_job, todo):
+            print(f'{file_path}: {rect_count} rects, {truck_count} trucks, {seconds:.2f} s')
+    return len(todo)
+
+
+def reproduce_legacy(directory, save_figures=False):
+    '''regenerate the files of generated_data, sequentially from the single global random stream'''
+    rd.seed(LEGACY_SEED)
+    for index_difficulty, rect_count in enumerate(RECT_COUNTS):
+        # figures of the trucks of difficulty 25
+        generate_legacy(rect_count, instance_path(directory, rect_count, 0),
+                        save_figures=save_figures and index_difficulty == 25)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='generate instances of the 2D truck packing problem')
+    parser.add_argument('--directory', default='files/generated_data', help='where to write the instances')
+    parser.add_argument('--counts', type=int, nargs='+', default=RECT_COUNTS, help='numbers of rects to generate')
+    parser.add_argument('--copies', type=int, default=1, help='number of instances of each number of rects')
+    parser.add_argument('--seed', type=int, default=LEGACY_SEED, help='seed of the corpus')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes, all cores by default')
+    parser.add_argument('--overwrite', action='store_true', help='regenerate existing files')
+    parser.add_argument('--legacy', action='store_true',
+                        help='reproduce the files of generated_data with the original sequential generator')
+    parser.add_argument('--figures', action='store_true',
+                        help='with --legacy, save the figures of difficulty 25 in files/generated_figures')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.directory, exist_ok=True)
+    start = time.time()
+
+    if args.legacy:
+        print('RANDOMIZING with seed:', LEGACY_SEED)
+        reproduce_legacy(args.directory, save_figures=args.figures)
+        count = len(RECT_COUNTS)
+    else:
+        count = generate_corpus(args.counts, args.directory, args.seed,
+                                copies=args.copies, jobs=args.jobs, overwrite=args.overwrite)
+
+    print(f'DONE: {count} instance(s) in {time.time() - start:.2f} s')
+
 
 if __name__ == '__main__':
-    if input('Type Y to generate: ') not in ['y', 'Y']:
-        raise Error('Type Y to generate')
-
-    np.set_printoptions(threshold=sys.maxsize, linewidth=sys.maxsize)
-
-    # numbers of rectangles based on difficulty (index)
-    rect_counts = [i for i in range(5, 55)] + \
-                  [i for i in range(60, 331, 30)] + \
-                  [i for i in range(350, 1000, 50)] +\
-                  [i for i in range(1000, 5001, 1000)]
-    print('rect_counts:', rect_counts)
-    print('len:', len(rect_counts))
-    print()
-
-    # seed
-    seed = 69420
-    rd.seed(seed)
-    print('RANDOMIZING with seed:', seed)
-    print()
-
-    # generate and save
-    for index_difficulty, rect_count in enumerate(rect_counts):
-        # create rects randomly
-        rects = rd_some_rects(rect_count)
-
-        # create trucks with rects
-        copy_rects = deepcopy(rects)  # save to recover later
-        trucks = list()  # list of tuples of size, cost not included
-
-        while rects:
-            # save figures of: BUILD 6TH truck OF DIFFICULTY 5
-            rects, picked_rects = rd_pick_some_rects(rects)
-            truck_array = rd_put(picked_rects,
-                               save_figures=index_difficulty==25 and len(trucks)==5)
-            shape = shape_after_remove_redundant(truck_array)
-            trucks.append(shape)
-
-            # save figures of: all trucks of difficulty 5
-            if index_difficulty == 25:
-                plot_full_truck_and_cut_truck(truck_array, remove_redundant(truck_array, shape), shape, len(trucks))
-
-        trucks += [rd_truck_size() for _ in range(ceil(len(trucks)/5))]
-
-        rects = copy_rects
-
-        # write to files
-        directory = 'files/generated_data'
-        file_path = f'{directory}/{str(rect_count).zfill(4)}.txt'
-
-        with open(file_path, 'w') as f:
-            f.write(f'{rect_count} {len(trucks)}\n')
-            for rect in rects:
-                f.write(f'{rect[0]} {rect[1]}\n')
-            for truck in trucks:
-                f.write(f'{truck[0]} {truck[1]} {rd_truck_cost()}\n')
-
-    print('DONE')
\ No newline at end of file
+    main()
@@ -0,0 +1,268 @@
+import argparse
+import io
+import math
+import multiprocessing
+import os
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from incremental import place_in_free_space
+from instance import Instance, Solution
+from local_search import improve, print_improvement
+from lower_bound import lower_bound, print_gap
+from solution_io import write_solution
+from verify import verify
+
+
+# rects per cluster when the number of clusters is not given
+CLUSTER_RECTS = 500
+# in auto mode, the clusters of at most this many rects are solved by CP, the others by best fit
+CP_MAX_RECTS = 40
+
+
+# -------------------------------- CLUSTERS --------------------------------
+def size_classes(instance: Instance):
+    '''size class of each rect, the power of two of its long side'''
+    return np.floor(np.log2(np.maximum(instance.widths, instance.heights))).astype(np.int64)
+
+
+def cluster_rects(instance: Instance, count) -> list:
+    '''
+    split the rects into count clusters balanced in size classes and area: sorted by size class then area,
+    in descending order, the rects are dealt back and forth (0 .. count-1, count-1 .. 0, ...),
+    return the indices of the rects of each cluster
+    '''
+    order = np.lexsort((-instance.areas, -size_classes(instance)))
+    turn = np.arange(instance.rect_count) % (2 * count)
+    cluster = np.where(turn < count, turn, 2 * count - 1 - turn)
+    return [order[cluster == k] for k in range(count)]
+
+
+def share_trucks(instance: Instance, clusters) -> list:
+    '''
+    give each cluster first the cheapest truck, by fee per area, that holds every one of its rects
+    (or else its largest rect), then each truck left, the cheapest first, to the cluster with the least
+    truck area per rect area so far, so each cluster gets a share of the fleet proportional to its area,
+    return the indices of the trucks of each cluster
+    '''
+    order = instance.truck_order()
+    short_sides = np.minimum(instance.truck_widths, instance.truck_heights)[order]
+    long_sides = np.maximum(instance.truck_widths, instance.truck_heights)[order]
+    free = np.ones(len(order), dtype=bool)
+    shares = [list() for _ in clusters]
+    for share, rects in zip(shares, clusters):
+        rect_short_sides = np.minimum(instance.widths[rects], instance.heights[rects])
+        rect_long_sides = np.maximum(instance.widths[rects], instance.heights[rects])
+        largest = np.argmax(instance.areas[rects])
+        for short_side, long_side in ((rect_short_sides.max(), rect_long_sides.max()),
+                                      (rect_short_sides[largest], rect_long_sides[largest])):
+            holds = free & (short_sides >= short_side) & (long_sides >= long_side)
+            if holds.any():
+                position = int(np.argmax(holds))
+                share.append(int(order[position]))
+                free[position] = False
+                break
+
+    rect_areas = np.array([instance.areas[rects].sum() for rects in clusters], dtype=np.float64)
+    truck_areas = np.array([instance.truck_areas[share].sum() for share in shares], dtype=np.float64)
+    for truck in order[free].tolist():
+        k = int(np.argmin(truck_areas / rect_areas))
+        shares[k].append(truck)
+        truck_areas[k] += instance.truck_areas[truck]
+    return [np.sort(np.asarray(share, dtype=np.int64)) for share in shares]
+
+
+# -------------------------------- SUB-SOLVES --------------------------------
+def _solve_cluster(rects, trucks, solver, budget, time_limit):
+    '''
+    solve one cluster in a pool worker, rects: (width, height), trucks: (width, height, cost),
+    CP gets what best fit left of the budget of the cluster, at most time_limit,
+    return (truck, rotated, x, y of the rects, the solver used, seconds),
+    the rects are left unplaced, for the repair, if the trucks of the cluster cannot hold them
+    '''
+    start = time.perf_counter()
+    instance = Instance(rects, trucks)
+    if solver == 'auto':
+        solver = 'cp' if instance.rect_count <= CP_MAX_RECTS else 'bestfit'
+
+    from bestfit import solve
+    try:
+        with redirect_stdout(io.StringIO()):
+            solution = solve(instance, budget=budget, local_search_time_limit=0.1 * budget)
+            if solver == 'cp':
+                # imported before the clock is read, the import of OR-Tools is part of the budget
+                from CP_model import _2DBinPackingCP
+            seconds_left = budget - (time.perf_counter() - start)
+            if solver == 'cp' and seconds_left > 0:
+                # best fit gives CP its hint, and stays the solution if CP finds none in time
+                model = _2DBinPackingCP(None, min(time_limit, seconds_left),
+                                        hint=solution if solution.is_complete() else None,
+                                        silent=True, instance=instance)
+                model.solve()
+                if getattr(model, 'solution', None) is not None:
+                    solution = model.solution
+    except ValueError:
+        solution, solver = Solution(instance), 'failed'
+    return solution.truck, solution.rotated, solution.x, solution.y, solver, time.perf_counter() - start
+
+
+def repair(solution: Solution, time_limit=1.0, bound=None) -> dict:
+    '''
+    place the rects the clusters left, first in the free space of the trucks in use,
+    then in the cheapest unused trucks that hold them,
+    and consolidate the partly filled trucks across the clusters with the local search,
+    return its stats
+    '''
+    instance = solution.instance
+    used = solution.used_trucks()
+    place_in_free_space(solution, np.flatnonzero(solution.truck < 0).tolist(),
+                        used[np.argsort(instance.fee_per_area[used], kind='stable')].tolist())
+    unused = np.setdiff1d(np.arange(instance.truck_count), solution.used_trucks())
+    unused = unused[np.argsort(instance.fee_per_area[unused], kind='stable')]
+    while not solution.is_complete() and len(unused):
+        left = np.flatnonzero(solution.truck < 0)
+        largest = left[np.argmax(instance.areas[left])]
+        long_side = max(instance.widths[largest], instance.heights[largest])
+        short_side = min(instance.widths[largest], instance.heights[largest])
+        holds = (np.maximum(instance.truck_widths[unused], instance.truck_heights[unused]) >= long_side) \
+            & (np.minimum(instance.truck_widths[unused], instance.truck_heights[unused]) >= short_side)
+        if not holds.any():
+            break
+        truck = unused[np.argmax(holds)]
+        unused = unused[unused != truck]
+        place_in_free_space(solution, left.tolist(), [int(truck)])
+    return improve(solution, time_limit=time_limit, bound=bound)
+
+
+def decompose(instance: Instance, clusters=None, solver='auto', jobs=None, budget=60.0, time_limit=10.0,
+              repair_time=1.0, bound=None, stats=None) -> Solution:
+    '''
+    split the rects into clusters (see cluster_rects), each with its share of the trucks (see share_trucks),
+    solve the clusters on a process pool with the solver ('bestfit', 'cp' or 'auto'),
+    best fit getting a part of budget seconds of fit search proportional to the rects of the cluster,
+    and CP what best fit left of it, at most time_limit seconds, then merge them and repair the result (see repair),
+    stats gets the clusters, the seconds of each phase and of each sub-solve
+    '''
+    start = time.perf_counter()
+    clusters = clusters or math.ceil(instance.rect_count / CLUSTER_RECTS)
+    clusters = max(1, min(clusters, instance.rect_count))
+    rect_clusters = cluster_rects(instance, clusters)
+    truck_shares = share_trucks(instance, rect_clusters)
+    split_seconds = time.perf_counter() - start
+
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['numpy', 'bestfit'])
+    jobs = jobs or min(clusters, os.cpu_count() or 1)
+    solution = Solution(instance)
+    sub_solves = list()
+    with context.Pool(jobs) as pool:
+        runs = [pool.apply_async(_solve_cluster, (
+            np.column_stack([instance.widths[rects], instance.heights[rects]]),
+            np.column_stack([instance.truck_widths[trucks], instance.truck_heights[trucks],
+                             instance.truck_costs[trucks]]),
+            solver, budget * len(rects) / instance.rect_count, time_limit))
+            for rects, trucks in zip(rect_clusters, truck_shares)]
+        for rects, trucks, run in zip(rect_clusters, truck_shares, runs):
+            truck, rotated, x, y, used_solver, seconds = run.get()
+            placed = truck >= 0
+            solution.truck[rects[placed]] = trucks[truck[placed]]
+            solution.rotated[rects] = rotated
+            solution.x[rects] = x
+            solution.y[rects] = y
+            sub_solves.append((len(rects), len(trucks), used_solver, int(placed.sum()), seconds))
+    solve_seconds = time.perf_counter() - start - split_seconds
+
+    merged_cost = solution.cost()
+    merged_left = int((solution.truck < 0).sum())
+    repair_stats = repair(solution, repair_time, bound)
+    if stats is not None:
+        stats.update(clusters=clusters, jobs=jobs, sub_solves=sub_solves, merged_cost=merged_cost,
+                     merged_left=merged_left, repair=repair_stats, split_seconds=split_seconds,
+                     solve_seconds=solve_seconds, seconds=time.perf_counter() - start)
+    return solution
+
+
+def print_sub_solves(stats) -> None:
+    print('-------------------- CLUSTERS --------------------')
+    print(f'{"cluster":>7} {"rects":>6} {"trucks":>6} {"solver":>8} {"placed":>6} {"seconds":>9}')
+    for k, (rects, trucks, solver, placed, seconds) in enumerate(stats['sub_solves']):
+        print(f'{k:7} {rects:6} {trucks:6} {solver:>8} {placed:6} {seconds:9.3f}')
+    print(f'Split: {stats["split_seconds"]:.3f} s, sub-solves: {stats["solve_seconds"]:.3f} s '
+          f'on {stats["jobs"]} process(es), sum {sum(solve[4] for solve in stats["sub_solves"]):.3f} s')
+    print(f'Merged cost: {stats["merged_cost"]}, rects left to the repair: {stats["merged_left"]}')
+
+
+# -------------------------------- SCALING --------------------------------
+def scaling_jobs(clusters) -> list:
+    '''1, 2, 4, ... processes up to the cores, and the cores themselves, at most one per cluster'''
+    cores = min(os.cpu_count() or 1, clusters)
+    return sorted({2 ** k for k in range(int(math.log2(cores)) + 1)} | {cores})
+
+
+def print_scaling(instance: Instance, clusters, solver, budget, time_limit, repair_time, bound) -> None:
+    '''decompose with more and more processes, print the wall time, speedup and efficiency of each'''
+    clusters = clusters or math.ceil(instance.rect_count / CLUSTER_RECTS)
+    print('-------------------- SCALING --------------------')
+    print(f'{os.cpu_count()} core(s), {clusters} clusters')
+    print(f'{"jobs":>4} {"wall (s)":>9} {"solves (s)":>10} {"speedup":>8} {"efficiency":>10} {"cost":>10}')
+    base = None
+    for jobs in scaling_jobs(clusters):
+        stats = dict()
+        solution = decompose(instance, clusters, solver, jobs, budget, time_limit, repair_time, bound, stats)
+        base = base or stats['seconds']
+        print(f'{jobs:4} {stats["seconds"]:9.3f} {stats["solve_seconds"]:10.3f} {base / stats["seconds"]:8.2f} '
+              f'{base / stats["seconds"] / jobs:10.2f} {solution.cost():10}')
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='decompose a large instance into clusters solved in parallel')
+    parser.add_argument('file_path', nargs='?', default='files/generated_data/5000.txt')
+    parser.add_argument('--clusters', type=int, default=None,
+                        help=f'number of clusters, one per {CLUSTER_RECTS} rects by default')
+    parser.add_argument('--solver', choices=['auto', 'bestfit', 'cp'], default='auto',
+                        help=f'solver of the clusters, auto: CP up to {CP_MAX_RECTS} rects, best fit above')
+    parser.add_argument('--jobs', type=int, default=None, help='processes, all cores by default')
+    parser.add_argument('--budget', type=float, default=60.0,
+                        help='total seconds of the fit searches of best fit, shared by the clusters')
+    parser.add_argument('--time-limit', type=float, default=10.0, help='seconds of CP per cluster, at most what best fit left of its budget')
+    parser.add_argument('--repair-time', type=float, default=1.0, help='seconds of the local search after the merge')
+    parser.add_argument('--scaling', action='store_true',
+                        help='run with 1, 2, 4, ... processes up to the cores and report the speedup')
+    parser.add_argument('--output', help='write the solution, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Solution:
+    args = parse_args(argv)
+    instance = Instance.from_file(args.file_path)
+    bound = lower_bound(instance.rect_list(), instance.truck_list())
+    if args.scaling:
+        print_scaling(instance, args.clusters, args.solver, args.budget, args.time_limit, args.repair_time, bound)
+        return None
+
+    stats = dict()
+    solution = decompose(instance, args.clusters, args.solver, args.jobs, args.budget, args.time_limit,
+                         args.repair_time, bound, stats)
+    errors = verify(solution)
+
+    print('-------------------- SOLUTION --------------------')
+    if args.output is not None:
+        write_solution(solution, args.output)
+    print(f'NUMBER OF TRUCKS USED: {len(solution.used_trucks())}')
+    print(f'COST: {solution.cost()}')
+    print_gap(solution.cost(), bound)
+    print('VALID' if not errors else f'INVALID: {errors[:3]}')
+
+    print('-------------------- OTHER STATS --------------------')
+    print(f'Total running time: {stats["seconds"]}')
+    print_sub_solves(stats)
+    print_improvement(stats['repair'])
+    return solution
+
+
+if __name__ == '__main__':
+    # the solution is left in the globals of the script, where service.run_solver reads it
+    solution = main()
@@ -0,0 +1,88 @@
+def orientations(rect, truck) -> list:
+    '''(width, height) of the orientations of the rect that fit the truck sides'''
+    return [(width, height) for width, height in (rect, rect[::-1])
+            if width <= truck[0] and height <= truck[1]]
+
+
+# -------------------------------- FILTERS --------------------------------
+# necessary conditions for rects to fit a truck together, each far cheaper than the fit search,
+# a filter returns False when the rects surely do not fit
+
+
+def sides(rects, truck) -> bool:
+    '''every rect fits the truck sides in some orientation, its longest side within the longest truck side'''
+    return all(orientations(rect, truck) for rect in rects)
+
+
+def wide_stack(rects, truck) -> bool:
+    '''
+    the wide rects, wider than half the truck in every orientation that fits, all cross the vertical
+    line at the middle of the truck, so they are stacked along it: their heights add up to at most its height
+    '''
+    total = 0
+    for rect in rects:
+        placed = orientations(rect, truck)
+        if not placed:
+            return False
+        if all(2 * width > truck[0] for width, _ in placed):
+            total += min(height for _, height in placed)
+    return total <= truck[1]
+
+
+def tall_stack(rects, truck) -> bool:
+    '''the same for the tall rects, side by side along the horizontal line at the middle of the truck'''
+    total = 0
+    for rect in rects:
+        placed = orientations(rect, truck)
+        if not placed:
+            return False
+        if all(2 * height > truck[1] for _, height in placed):
+            total += min(width for width, _ in placed)
+    return total <= truck[0]
+
+
+def wide_and_tall(rects, truck) -> bool:
+    '''the rects both wide and tall all cover the center of the truck, so there is at most one'''
+    count = 0
+    for rect in rects:
+        if all(2 * width > truck[0] and 2 * height > truck[1] for width, height in orientations(rect, truck)):
+            count += 1
+    return count <= 1
+
+
+def knapsack_side(sides, length) -> int:
+    '''largest sum up to length of the sides of distinct rects, each rect giving one of its two sides, or none'''
+    mask = (1 << (length + 1)) - 1
+    reachable = 1
+    for first, second in sides:
+        reachable |= ((reachable << first) | (reachable << second)) & mask
+    return reachable.bit_length() - 1
+
+
+def knapsack_area(rects, truck) -> bool:
+    '''
+    pushed to the bottom left, the rects of a packing end at sums of the sides of the rects before them,
+    so they all lie in the truck reduced to the largest such sums: their area is at most the reduced area
+    '''
+    width = knapsack_side(rects, truck[0])
+    height = knapsack_side(rects, truck[1])
+    return sum(rect[0] * rect[1] for rect in rects) <= width * height
+
+
+# filters in the order they are tried, cheapest first,
+# sides first so the others only see rects that fit the truck in some orientation
+FILTERS = (
+    ('sides', sides),
+    ('wide_and_tall', wide_and_tall),
+    ('wide_stack', wide_stack),
+    ('tall_stack', tall_stack),
+    ('knapsack_area', knapsack_area),
+)
+
+
+def rejected_by(rects, truck):
+    '''name of the first filter that proves the rects do not fit the truck together, None if none does'''
+    for name, passes in FILTERS:
+        if not passes(rects, truck):
+            return name
+    return None
@@ -0,0 +1,270 @@
+import argparse
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from bestfit import fit_free_space
+from instance import Instance, Solution
+from solution_io import write_solution
+from verify import read_solution, verify
+
+
+# unused trucks given to the re-solve: the cheapest by fee per area until their area is SLACK times the area to place
+SLACK = 2.0
+# and at most this many of them
+MAX_NEW_TRUCKS = 8
+
+
+# -------------------------------- DELTA --------------------------------
+class Delta:
+    '''
+    a small change of an instance:
+        added_rects: (width, height) of the new rects, numbered after the kept ones
+        removed_rects: indices of the rects taken out
+        unavailable_trucks: indices of the trucks that can no longer be used
+    '''
+    __slots__ = ('added_rects', 'removed_rects', 'unavailable_trucks')
+
+    def __init__(self, added_rects=(), removed_rects=(), unavailable_trucks=()) -> None:
+        self.added_rects = [tuple(rect) for rect in added_rects]
+        self.removed_rects = sorted(set(removed_rects))
+        self.unavailable_trucks = sorted(set(unavailable_trucks))
+
+    def apply(self, instance: Instance):
+        '''
+        return (the changed instance, the index in instance of each of its rects, -1 for the added ones,
+        the index in instance of each of its trucks), the rects and trucks kept stay in their order
+        '''
+        kept = np.setdiff1d(np.arange(instance.rect_count), self.removed_rects)
+        truck_map = np.setdiff1d(np.arange(instance.truck_count), self.unavailable_trucks)
+        rects = np.concatenate([np.column_stack([instance.widths, instance.heights])[kept],
+                                np.asarray(self.added_rects, dtype=np.int32).reshape(-1, 2)])
+        trucks = np.column_stack([instance.truck_widths, instance.truck_heights, instance.truck_costs])[truck_map]
+        rect_map = np.concatenate([kept, np.full(len(self.added_rects), -1)])
+        return Instance(rects, trucks), rect_map, truck_map
+
+
+def carry_over(previous: Solution, instance: Instance, rect_map, truck_map):
+    '''
+    the previous solution on the changed instance: the kept rects stay where they were, unless their truck
+    is gone; return (the solution, with the other rects not placed, the trucks that lost a rect)
+    '''
+    # index in the changed instance of each previous truck, -1 for the unavailable ones
+    new_truck = np.full(previous.instance.truck_count + 1, -1)
+    new_truck[truck_map] = np.arange(len(truck_map))
+
+    solution = Solution(instance)
+    kept = np.flatnonzero(rect_map >= 0)
+    old = rect_map[kept]
+    # previous.truck is -1 for a rect that was not placed, which maps to the -1 of the extra last slot
+    solution.truck[kept] = new_truck[previous.truck[old]]
+    solution.rotated[kept] = previous.rotated[old]
+    solution.x[kept] = previous.x[old]
+    solution.y[kept] = previous.y[old]
+
+    removed = np.setdiff1d(np.arange(previous.instance.rect_count), rect_map[kept])
+    lost_rect = new_truck[previous.truck[removed]]
+    return solution, np.unique(lost_rect[lost_rect >= 0])
+
+
+# -------------------------------- SUB-PROBLEM --------------------------------
+def new_trucks(solution: Solution, free, reopened):
+    '''
+    the unused trucks given to the re-solve, cheapest by fee per area first,
+    until their area (with the area left in the reopened ones) is SLACK times the area of the free rects,
+    at most MAX_NEW_TRUCKS,
+    plus, for each free rect no truck so far can hold, the cheapest unused one that can
+    '''
+    instance = solution.instance
+    unused = np.setdiff1d(np.arange(instance.truck_count), solution.used_trucks())
+    unused = unused[np.argsort(instance.fee_per_area[unused], kind='stable')]
+    area_left = instance.truck_areas[reopened].sum() - instance.areas[np.isin(solution.truck, reopened)].sum()
+    needed = SLACK * instance.areas[free].sum() - area_left
+    chosen = unused[:min(int(np.searchsorted(np.cumsum(instance.truck_areas[unused]), needed)) + 1,
+                         MAX_NEW_TRUCKS)] if needed > 0 else unused[:0]
+
+    def holds(trucks, rect):
+        long_side, short_side = max(instance.widths[rect], instance.heights[rect]), \
+            min(instance.widths[rect], instance.heights[rect])
+        return (np.maximum(instance.truck_widths[trucks], instance.truck_heights[trucks]) >= long_side) \
+            & (np.minimum(instance.truck_widths[trucks], instance.truck_heights[trucks]) >= short_side)
+
+    chosen = list(chosen)
+    for rect in free.tolist():
+        if not holds(np.asarray(list(reopened) + chosen, dtype=np.int64), rect).any():
+            fitting = unused[holds(unused, rect)]
+            if len(fitting):
+                chosen.append(fitting[0])
+    return np.unique(np.asarray(chosen, dtype=np.int64))
+
+
+def place_in_free_space(solution: Solution, rects, trucks) -> Solution:
+    '''
+    place the rects, largest first, each in the free space of the first of the trucks (indices, in order) that holds it,
+    around the rects already there; the rects that fit nowhere stay as they are
+    '''
+    instance = solution.instance
+    truck_sizes = instance.truck_list()
+    contents = {truck: ([], []) for truck in trucks}
+    for k in np.flatnonzero(np.isin(solution.truck, trucks)).tolist():
+        placed_rects, placements = contents[int(solution.truck[k])]
+        placed_rects.append((int(instance.widths[k]), int(instance.heights[k])))
+        placements.append((int(solution.x[k]), int(solution.y[k]), not solution.rotated[k]))
+
+    for k in sorted(rects, key=lambda k: -int(instance.areas[k])):
+        rect = (int(instance.widths[k]), int(instance.heights[k]))
+        for truck in trucks:
+            placed_rects, placements = contents[truck]
+            placement = fit_free_space(rect, truck_sizes[truck], placed_rects, placements)
+            if placement is not None:
+                x, y, not_rotated = placement
+                solution.place(k, truck, not not_rotated, x, y)
+                placed_rects.append(rect)
+                placements.append(placement)
+                break
+    return solution
+
+
+def sub_problem(solution: Solution, rects, trucks, free_count):
+    '''
+    (the instance of the rects and trucks, renumbered from 0, the hint: the rects keep their placements
+    but the first free_count ones, which are placed greedily, if they fit)
+    '''
+    instance = solution.instance
+    sub = Instance(np.column_stack([instance.widths[rects], instance.heights[rects]]),
+                   np.column_stack([instance.truck_widths[trucks], instance.truck_heights[trucks],
+                                    instance.truck_costs[trucks]]))
+    position = {truck: k for k, truck in enumerate(trucks.tolist())}
+    hint = Solution(sub)
+    for k, rect in enumerate(rects.tolist()):
+        if solution.truck[rect] >= 0:
+            hint.place(k, position[int(solution.truck[rect])], solution.rotated[rect], solution.x[rect], solution.y[rect])
+    return sub, place_in_free_space(hint, range(free_count), sub.truck_order().tolist())
+
+
+def resolve(previous: Solution, delta: Delta, time_limit=10.0, reopen=(), stats=None) -> Solution:
+    '''
+    re-optimize the previous solution after the delta, without rebuilding the whole model:
+        the free rects (the new ones, and those of the unavailable trucks) first go to the free space
+        of the trucks in use, at no cost,
+        the trucks the delta does not touch then stay fixed as they are, out of the model,
+        the free rects left and the rects of the trucks that lost one (and of the trucks in reopen,
+        indices of the changed instance) are re-packed by CP into those trucks and a few unused ones
+        (see new_trucks), starting from their previous placements completed greedily, as hint and bound of the cost,
+        with one more unused truck, the cheapest that holds the largest rect left, while the greedy leaves some
+        (if none holds it, CP starts without a hint)
+    return the solution of the changed instance
+    '''
+    start = time.perf_counter()
+    instance, rect_map, truck_map = delta.apply(previous.instance)
+    solution, reopened = carry_over(previous, instance, rect_map, truck_map)
+    reopened = np.union1d(reopened, np.asarray(reopen, dtype=np.int64)).astype(np.int64)
+    used = solution.used_trucks()
+    place_in_free_space(solution, np.flatnonzero(solution.truck < 0).tolist(),
+                        used[np.argsort(instance.fee_per_area[used], kind='stable')].tolist())
+    free = np.flatnonzero(solution.truck < 0)
+    long_sides = np.maximum(instance.truck_widths, instance.truck_heights).max()
+    short_sides = np.minimum(instance.truck_widths, instance.truck_heights).max()
+    for rect in free.tolist():
+        if max(instance.widths[rect], instance.heights[rect]) > long_sides \
+                or min(instance.widths[rect], instance.heights[rect]) > short_sides:
+            raise ValueError(f'rect {rect} ({instance.widths[rect]} x {instance.heights[rect]}) fits no truck')
+    trucks = np.union1d(reopened, new_trucks(solution, free, reopened)).astype(np.int64)
+    rects = np.concatenate([free, np.flatnonzero(np.isin(solution.truck, reopened))]).astype(np.int64)
+    if stats is not None:
+        stats.update(rects=len(rects), trucks=len(trucks), fixed_trucks=len(solution.used_trucks()) - len(
+            np.intersect1d(solution.used_trucks(), reopened)), free_rects=len(free))
+    if len(rects) == 0:
+        return solution
+
+    sub, hint = sub_problem(solution, rects, trucks, len(free))
+    unused = np.setdiff1d(np.arange(instance.truck_count), np.union1d(solution.used_trucks(), trucks))
+    unused = unused[np.argsort(instance.fee_per_area[unused], kind='stable')]
+    while not hint.is_complete() and len(unused):
+        left = np.flatnonzero(hint.truck < 0)
+        largest = rects[left[np.argmax(sub.areas[left])]]
+        long_side = max(instance.widths[largest], instance.heights[largest])
+        short_side = min(instance.widths[largest], instance.heights[largest])
+        holds = (np.maximum(instance.truck_widths[unused], instance.truck_heights[unused]) >= long_side) \
+            & (np.minimum(instance.truck_widths[unused], instance.truck_heights[unused]) >= short_side)
+        if not holds.any():
+            break
+        truck = unused[np.argmax(holds)]
+        unused = unused[unused != truck]
+        trucks = np.union1d(trucks, [truck]).astype(np.int64)
+        sub, hint = sub_problem(solution, rects, trucks, len(free))
+    if stats is not None:
+        stats.update(trucks=len(trucks))
+
+    from CP_model import _2DBinPackingCP
+    model = _2DBinPackingCP(None, time_limit, hint=hint if hint.is_complete() else None, silent=True, instance=sub)
+    with redirect_stdout(io.StringIO()):
+        model.solve()
+    sub_solution = getattr(model, 'solution', None)
+    if sub_solution is None:
+        if not hint.is_complete():
+            raise ValueError(f'no solution of the re-solve of {len(rects)} rects in {len(trucks)} trucks '
+                             f'in {time_limit} s')
+        sub_solution = hint
+
+    solution.truck[rects] = trucks[sub_solution.truck]
+    solution.rotated[rects] = sub_solution.rotated
+    solution.x[rects] = sub_solution.x
+    solution.y[rects] = sub_solution.y
+    if stats is not None:
+        stats.update(hint_cost=hint.cost() if hint.is_complete() else None, sub_cost=sub_solution.cost(),
+                     status=model.solver.StatusName(model.status), seconds=time.perf_counter() - start)
+    return solution
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='re-solve a solution with CP after a small change of its instance')
+    parser.add_argument('instance', help='the instance before the change')
+    parser.add_argument('solution', help='its solution, .csv, .jsonl, .npz, or the output of CP, MIP or bestfit')
+    parser.add_argument('--add', nargs=2, type=int, action='append', default=[], metavar=('WIDTH', 'HEIGHT'),
+                        help='a new rect, repeat for more')
+    parser.add_argument('--remove', nargs='+', type=int, default=[], help='indices of the rects taken out')
+    parser.add_argument('--unavailable', nargs='+', type=int, default=[], help='indices of the trucks gone')
+    parser.add_argument('--reopen', nargs='+', type=int, default=[],
+                        help='indices (after the change) of more trucks to re-pack')
+    parser.add_argument('--time-limit', type=float, default=10, help='seconds of CP')
+    parser.add_argument('--output', help='write the solution of the changed instance, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instance = Instance.from_file(args.instance)
+    previous, _ = read_solution(instance, args.solution)
+    delta = Delta(args.add, args.remove, args.unavailable)
+
+    stats = dict()
+    try:
+        solution = resolve(previous, delta, args.time_limit, args.reopen, stats)
+    except ValueError as error:
+        print(f'error: {error}', file=sys.stderr)
+        return 2
+    errors = verify(solution)
+
+    print('-------------------- RE-SOLVE --------------------')
+    print(f'Delta: {len(delta.added_rects)} added, {len(delta.removed_rects)} removed, '
+          f'{len(delta.unavailable_trucks)} unavailable truck(s)')
+    print(f'Re-packed: {stats["rects"]} rects ({stats["free_rects"]} free) in {stats["trucks"]} trucks, '
+          f'{stats["fixed_trucks"]} trucks fixed')
+    if 'status' in stats:
+        print(f'Status: {stats["status"]}, greedy cost: {stats["hint_cost"]}, re-packed cost: {stats["sub_cost"]}, '
+              f'time: {stats["seconds"]:.3f} s')
+    print(f'COST BEFORE: {previous.cost()}')
+    print(f'COST: {solution.cost()}')
+    print('VALID' if not errors else f'INVALID: {errors[:3]}')
+    if args.output is not None:
+        write_solution(solution, args.output)
+    return 0 if not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+
+# -------------------------------- PARSE --------------------------------
+def _parse_tokens(file_path):
+    '''parse the whole text file in one call, return a flat int array of every token'''
+    with open(file_path, 'rb') as f:
+        return np.fromstring(f.read(), dtype=np.int32, sep=' ')
+
+
+def _split_tokens(tokens, file_path):
+    '''
+    validate the flat token array, then split it into
+        rects: (rect_count, 2) array of width, height
+        trucks: (truck_count, 3) array of width, height, cost
+    '''
+    if len(tokens) < 2:
+        raise ValueError(f'{file_path}: missing the header line')
+
+    rect_count, truck_count = int(tokens[0]), int(tokens[1])
+    expected = 2 + 2 * rect_count + 3 * truck_count
+    if rect_count < 0 or truck_count < 0 or len(tokens) != expected:
+        raise ValueError(f'{file_path}: expected {expected} numbers for '
+                         f'{rect_count} rects and {truck_count} trucks, got {len(tokens)}')
+
+    rects = tokens[2: 2 + 2 * rect_count].reshape(rect_count, 2)
+    trucks = tokens[2 + 2 * rect_count:].reshape(truck_count, 3)
+    return rects, trucks
+
+
+# -------------------------------- CACHE --------------------------------
+# set to anything but empty to use the .npy caches by default, e.g. by --cache-instances,
+# so the solvers run by the benchmark and the service use them too
+CACHE_ENV = 'INSTANCE_CACHE'
+
+
+def cache_enabled() -> bool:
+    return bool(os.environ.get(CACHE_ENV))
+
+
+def enable_cache() -> None:
+    '''use the .npy caches in this process and in the processes it starts'''
+    os.environ[CACHE_ENV] = '1'
+
+
+def cache_path(file_path):
+    '''the binary cache lives next to the text file, e.g. generated_data/0005.npy'''
+    return os.path.splitext(file_path)[0] + '.npy'
+
+
+def _cache_is_fresh(file_path, npy_path):
+    return os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(file_path)
+
+
+def write_cache(file_path, tokens):
+    '''save the flat token array as .npy, written to a temp file then renamed so readers never see half a file'''
+    npy_path = cache_path(file_path)
+    tmp_path = f'{npy_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, tokens)
+    os.replace(tmp_path, npy_path)
+
+
+# -------------------------------- READ INPUT --------------------------------
+def read_instance(file_path, cache=None):
+    '''
+    read an instance file, return (rects, trucks) as int arrays:
+        rects: (rect_count, 2) of width, height
+        trucks: (truck_count, 3) of width, height, cost
+    if cache is True, a memory-mapped .npy next to the file is used when up to date,
+    and (re)written otherwise, if None, the cache is used iff $INSTANCE_CACHE is set
+    '''
+    if cache is None:
+        cache = cache_enabled()
+    if cache:
+        npy_path = cache_path(file_path)
+        if _cache_is_fresh(file_path, npy_path):
+            return _split_tokens(np.load(npy_path, mmap_mode='r'), npy_path)
+
+    tokens = _parse_tokens(file_path)
+    rects, trucks = _split_tokens(tokens, file_path)
+    if cache:
+        write_cache(file_path, tokens)
+    return rects, trucks
+
+
+# -------------------------------- INSTANCE --------------------------------
+class Instance:
+    '''
+    structure of arrays of an instance, shared by every solver
+        rects: widths, heights, areas
+        trucks: truck_widths, truck_heights, truck_costs, truck_areas, fee_per_area
+    '''
+    __slots__ = ('widths', 'heights', 'areas',
+                 'truck_widths', 'truck_heights', 'truck_costs', 'truck_areas', 'fee_per_area')
+
+    def __init__(self, rects, trucks) -> None:
+        rects = np.asarray(rects, dtype=np.int32).reshape(-1, 2)
+        trucks = np.asarray(trucks, dtype=np.int32).reshape(-1, 3)
+
+        self.widths = np.ascontiguousarray(rects[:, 0])
+        self.heights = np.ascontiguousarray(rects[:, 1])
+        self.areas = self.widths * self.heights
+
+        self.truck_widths = np.ascontiguousarray(trucks[:, 0])
+        self.truck_heights = np.ascontiguousarray(trucks[:, 1])
+        self.truck_costs = np.ascontiguousarray(trucks[:, 2])
+        self.truck_areas = self.truck_widths * self.truck_heights
+        self.fee_per_area = self.truck_costs / self.truck_areas
+
+    @classmethod
+    def from_file(cls, file_path, cache=None):
+        return cls(*read_instance(file_path, cache=cache))
+
+    @property
+    def rect_count(self) -> int:
+        return len(self.widths)
+
+    @property
+    def truck_count(self) -> int:
+        return len(self.truck_widths)
+
+    def rect_values(self, key='area'):
+        '''value of each rect for the key: area, max_side_length or perimeter'''
+        if key == 'area':
+            return self.areas
+        elif key == 'max_side_length':
+            return np.maximum(self.widths, self.heights)
+        elif key == 'perimeter':
+            return 2 * (self.widths + self.heights)
+        raise ValueError(f'unknown rect sort key: {key}')
+
+    def rect_order(self, key='area'):
+        '''
+        indices of rects sorted in descending order of key (see rect_values),
+        stable, so ties keep the order of the file
+        '''
+        return np.argsort(-self.rect_values(key), kind='stable')
+
+    def truck_order(self, key='fee_per_area'):
+        '''
+        indices of trucks sorted by key, stable:
+            'fee_per_area' or 'cost' in ascending order, 'area' in descending order
+        '''
+        if key == 'fee_per_area':
+            return np.argsort(self.fee_per_area, kind='stable')
+        elif key == 'cost':
+            return np.argsort(self.truck_costs, kind='stable')
+        elif key == 'area':
+            return np.argsort(-self.truck_areas, kind='stable')
+        raise ValueError(f'unknown truck sort key: {key}')
+
+    def rect_list(self, order=None) -> list:
+        '''list of (width, height) tuples, in the given order of indices'''
+        if order is None:
+            return list(zip(self.widths.tolist(), self.heights.tolist()))
+        return list(zip(self.widths[order].tolist(), self.heights[order].tolist()))
+
+    def truck_list(self, order=None) -> list:
+        '''list of (width, height, cost) tuples, in the given order of indices'''
+        if order is None:
+            order = slice(None)
+        return list(zip(self.truck_widths[order].tolist(),
+                        self.truck_heights[order].tolist(),
+                        self.truck_costs[order].tolist()))
+
+
+# -------------------------------- SOLUTION --------------------------------
+class Solution:
+    '''
+    structure of arrays of a solution, indexed like the rects of the instance:
+        truck: index of the truck the rect is put in (in the instance order), -1 if not placed
+        rotated: True iff the rect rotates 90 degrees
+        x, y: coordinate of the corner of the rect in the truck,
+              x along the width and y along the height of the truck
+    '''
+    __slots__ = ('instance', 'truck', 'rotated', 'x', 'y')
+
+    def __init__(self, instance: Instance) -> None:
+        self.instance = instance
+        self.truck = np.full(instance.rect_count, -1, dtype=np.int32)
+        self.rotated = np.zeros(instance.rect_count, dtype=bool)
+        self.x = np.zeros(instance.rect_count, dtype=np.int32)
+        self.y = np.zeros(instance.rect_count, dtype=np.int32)
+
+    def place(self, rect, truck, rotated, x, y) -> None:
+        self.truck[rect] = truck
+        self.rotated[rect] = rotated
+        self.x[rect] = x
+        self.y[rect] = y
+
+    def placed_widths(self):
+        return np.where(self.rotated, self.instance.heights, self.instance.widths)
+
+    def placed_heights(self):
+        return np.where(self.rotated, self.instance.widths, self.instance.heights)
+
+    def used_trucks(self):
+        '''sorted indices of the trucks containing at least one rect'''
+        return np.unique(self.truck[self.truck >= 0])
+
+    def cost(self) -> int:
+        return int(self.instance.truck_costs[self.used_trucks()].sum())
+
+    def is_complete(self) -> bool:
+        return bool((self.truck >= 0).all())
+
+    def inside_trucks(self) -> bool:
+        '''True iff every placed rect lies inside its truck, overlaps are not checked'''
+        placed = self.truck >= 0
+        truck = self.truck[placed]
+        return bool(
+            (self.x[placed] >= 0).all() and (self.y[placed] >= 0).all()
+            and (self.x[placed] + self.placed_widths()[placed] <= self.instance.truck_widths[truck]).all()
+            and (self.y[placed] + self.placed_heights()[placed] <= self.instance.truck_heights[truck]).all()
+        )
+
+
+# -------------------------------- MAIN --------------------------------
+if __name__ == '__main__':
+    # build the caches of the given files and compare the loading time
+    for file_path in sys.argv[1:]:
+        start = time.perf_counter()
+        read_instance(file_path, cache=False)
+        text_time = time.perf_counter() - start
+
+        read_instance(file_path, cache=True)
+        start = time.perf_counter()
+        rects, trucks = read_instance(file_path, cache=True)
+        # touch the data so the memory map is actually read
+        int(rects.sum() + trucks.sum())
+        cache_time = time.perf_counter() - start
+
+        print(f'{file_path}: {len(rects)} rects, {len(trucks)} trucks, '
+              f'text {text_time * 1000:.2f} ms, cache {cache_time * 1000:.2f} ms')
@@ -0,0 +1,204 @@
+import time
+
+import numpy as np
+
+from instance import Solution
+
+
+# -------------------------------- TRUCK STATE --------------------------------
+class LoadedTruck:
+    '''
+    a used truck of the solution: its occupancy grid (True if occupied)
+    and the indices of the rects it contains
+    '''
+    __slots__ = ('index', 'grid', 'rects', 'area_left')
+
+    def __init__(self, index, width, height) -> None:
+        self.index = index
+        self.grid = np.zeros((width, height), dtype=bool)
+        self.rects = list()
+        self.area_left = width * height
+
+    def free_position(self, width, height):
+        '''
+        return the lowest (x, y) where a width x height rect fits the free space, None if there is none,
+        every position is tested at once with the summed-area table of the grid
+        '''
+        grid_width, grid_height = self.grid.shape
+        if width > grid_width or height > grid_height:
+            return None
+        table = np.zeros((grid_width + 1, grid_height + 1), dtype=np.int32)
+        table[1:, 1:] = self.grid.cumsum(axis=0).cumsum(axis=1)
+        occupied = table[width:, height:] - table[:-width, height:] - table[width:, :-height] + table[:-width, :-height]
+        free = np.argwhere(occupied == 0)
+        if len(free) == 0:
+            return None
+        return int(free[0][0]), int(free[0][1])
+
+    def fill(self, x, y, width, height, value) -> None:
+        self.grid[x: x + width, y: y + height] = value
+        self.area_left += -width * height if value else width * height
+
+
+def _load_trucks(solution: Solution) -> dict:
+    '''build the occupancy grid of every used truck, keyed by truck index'''
+    instance = solution.instance
+    widths, heights = solution.placed_widths(), solution.placed_heights()
+    loaded = dict()
+    for rect in np.flatnonzero(solution.truck >= 0).tolist():
+        index = int(solution.truck[rect])
+        if index not in loaded:
+            loaded[index] = LoadedTruck(index, int(instance.truck_widths[index]), int(instance.truck_heights[index]))
+        loaded[index].fill(int(solution.x[rect]), int(solution.y[rect]), int(widths[rect]), int(heights[rect]), True)
+        loaded[index].rects.append(rect)
+    return loaded
+
+
+# -------------------------------- MOVES --------------------------------
+def _place_somewhere(solution, rect, targets):
+    '''put the rect in the first target truck with room for it, in any orientation, return the truck or None'''
+    instance = solution.instance
+    width, height = int(instance.widths[rect]), int(instance.heights[rect])
+    for target in targets:
+        if target.area_left < width * height:
+            continue
+        for rotated, (w, h) in ((False, (width, height)), (True, (height, width))):
+            position = target.free_position(w, h)
+            if position is not None:
+                target.fill(position[0], position[1], w, h, True)
+                target.rects.append(rect)
+                solution.place(rect, target.index, rotated, *position)
+                return target
+    return None
+
+
+def empty_truck(solution, loaded, truck: LoadedTruck) -> bool:
+    '''
+    relocate every rect of the truck into the other used trucks, fullest first,
+    keep the move only if the truck ends up empty, else roll it back
+    '''
+    targets = sorted((t for t in loaded.values() if t is not truck), key=lambda t: t.area_left)
+    rects = sorted(truck.rects, key=lambda rect: -int(solution.instance.areas[rect]))
+    saved = [(rect, int(solution.truck[rect]), bool(solution.rotated[rect]), int(solution.x[rect]), int(solution.y[rect]))
+             for rect in rects]
+
+    moved = list()
+    for rect in rects:
+        target = _place_somewhere(solution, rect, targets)
+        if target is None:
+            break
+        moved.append((rect, target))
+    else:
+        del loaded[truck.index]
+        return True
+
+    # roll back
+    widths, heights = solution.placed_widths(), solution.placed_heights()
+    for rect, target in moved:
+        target.fill(int(solution.x[rect]), int(solution.y[rect]), int(widths[rect]), int(heights[rect]), False)
+        target.rects.remove(rect)
+    for rect, truck_index, rotated, x, y in saved:
+        solution.place(rect, truck_index, rotated, x, y)
+    return False
+
+
+def swap_truck(solution, loaded, truck: LoadedTruck, used):
+    '''
+    move the whole load of the truck, as it is placed, to the cheapest unused truck that still holds it,
+    transposing the layout if needed, return the cost delta (0 if no cheaper truck fits)
+    '''
+    instance = solution.instance
+    rects = np.asarray(truck.rects)
+    load_width = int((solution.x[rects] + solution.placed_widths()[rects]).max())
+    load_height = int((solution.y[rects] + solution.placed_heights()[rects]).max())
+
+    W, H = instance.truck_widths, instance.truck_heights
+    as_is = (load_width <= W) & (load_height <= H)
+    transposed = (load_height <= W) & (load_width <= H)
+    cost = instance.truck_costs[truck.index]
+    candidates = np.flatnonzero(~used & (as_is | transposed) & (instance.truck_costs < cost))
+    if len(candidates) == 0:
+        return 0
+
+    new_index = int(candidates[np.argmin(instance.truck_costs[candidates])])
+    if not as_is[new_index]:
+        solution.x[rects], solution.y[rects] = solution.y[rects].copy(), solution.x[rects].copy()
+        solution.rotated[rects] = ~solution.rotated[rects]
+        truck.grid = truck.grid.T
+    solution.truck[rects] = new_index
+
+    # move the grid into a truck of the new size
+    new_truck = LoadedTruck(new_index, int(W[new_index]), int(H[new_index]))
+    new_truck.grid[:truck.grid.shape[0], :truck.grid.shape[1]] |= truck.grid[:new_truck.grid.shape[0], :new_truck.grid.shape[1]]
+    new_truck.area_left -= int(new_truck.grid.sum())
+    new_truck.rects = truck.rects
+    del loaded[truck.index]
+    loaded[new_index] = new_truck
+    used[truck.index], used[new_index] = False, True
+    return int(instance.truck_costs[new_index]) - int(cost)
+
+
+# -------------------------------- IMPROVE --------------------------------
+def improve(solution: Solution, time_limit=1.0, bound=None) -> dict:
+    '''
+    improve the solution in place until no move helps, the time limit (seconds) is reached,
+    or the cost meets the lower bound:
+        empty the least filled (then costliest) trucks by relocating their rects into the other trucks,
+        swap trucks for cheaper unused ones that still hold their load
+    the cost is kept up to date by the delta of each move,
+    return the stats of the run
+    '''
+    start = time.time()
+    instance = solution.instance
+    loaded = _load_trucks(solution)
+    used = np.zeros(instance.truck_count, dtype=bool)
+    used[list(loaded)] = True
+
+    initial_cost = cost = int(instance.truck_costs[used].sum())
+    emptied = swapped = 0
+
+    def out_of_time():
+        return time.time() - start > time_limit or (bound is not None and cost <= bound)
+
+    improved = True
+    while improved and not out_of_time():
+        improved = False
+
+        # least utilized first, then costliest first
+        order = sorted(loaded.values(), key=lambda t: (1 - t.area_left / t.grid.size, -int(instance.truck_costs[t.index])))
+        for truck in order:
+            if out_of_time():
+                break
+            if truck.index in loaded and empty_truck(solution, loaded, truck):
+                used[truck.index] = False
+                cost -= int(instance.truck_costs[truck.index])
+                emptied += 1
+                improved = True
+
+        for truck in sorted(loaded.values(), key=lambda t: -int(instance.truck_costs[t.index])):
+            if out_of_time():
+                break
+            delta = swap_truck(solution, loaded, truck, used)
+            if delta:
+                cost += delta
+                swapped += 1
+                improved = True
+
+    seconds = time.time() - start
+    return {
+        'initial_cost': initial_cost,
+        'cost': cost,
+        'trucks_emptied': emptied,
+        'trucks_swapped': swapped,
+        'seconds': seconds,
+        'reduction_per_second': (initial_cost - cost) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def print_improvement(stats) -> None:
+    print('-------------------- LOCAL SEARCH --------------------')
+    print(f'COST BEFORE: {stats["initial_cost"]}')
+    print(f'COST AFTER: {stats["cost"]}')
+    print(f'Trucks emptied: {stats["trucks_emptied"]}, trucks swapped: {stats["trucks_swapped"]}')
+    print(f'Local search time: {stats["seconds"]}')
+    print(f'Cost reduction per second: {stats["reduction_per_second"]:.2f}')
@@ -0,0 +1,112 @@
+from math import ceil
+
+import numpy as np
+
+
+# -------------------------------- PREPARE --------------------------------
+def _as_arrays(rects, trucks):
+    '''
+    return (rect_sizes, truck_sizes, truck_costs) as numpy arrays,
+    rects can be lists/tuples of (width, height) or objects with .width/.height
+    '''
+    if len(rects) and hasattr(rects[0], 'width'):
+        rects = [(rect.width, rect.height) for rect in rects]
+    rects = np.asarray(rects, dtype=np.int64).reshape(-1, 2)
+    trucks = np.asarray(trucks, dtype=np.int64).reshape(-1, 3)
+    return rects, trucks[:, :2], trucks[:, 2]
+
+
+def _fit_matrix(rect_types, truck_sizes):
+    '''
+    fits[k, j] is True iff the rect type k fits the empty truck j, in any orientation
+    '''
+    w, h = rect_types[:, 0:1], rect_types[:, 1:2]
+    W, H = truck_sizes[:, 0], truck_sizes[:, 1]
+    return ((w <= W) & (h <= H)) | ((h <= W) & (w <= H))
+
+
+# -------------------------------- BOUNDS --------------------------------
+def area_bound(rect_types, counts, truck_sizes, truck_costs, fits):
+    '''
+    every unit of area of a rect is paid at least the cheapest fee per area
+    among the trucks that can hold it
+    '''
+    fee_per_area = truck_costs / (truck_sizes[:, 0] * truck_sizes[:, 1])
+    cheapest = np.where(fits, fee_per_area, np.inf).min(axis=1)
+    return float((rect_types[:, 0] * rect_types[:, 1] * counts * cheapest).sum())
+
+
+def l2_bound(rect_types, counts, truck_sizes, truck_costs, fits):
+    '''
+    Martello-Vigo style bound adapted to heterogeneous trucks:
+    a rect is "big" in a truck if its shorter side is more than half of the longer side of the truck,
+    so no two big rects can share that truck. Rects that are big in every truck they fit
+    need pairwise distinct trucks, which costs at least the cheapest trucks among those admissible
+    '''
+    half = truck_sizes.max(axis=1) / 2
+    big = fits & (rect_types.min(axis=1)[:, None] > half)
+    always_big = (big == fits).all(axis=1)
+    big_count = int(counts[always_big].sum())
+    if big_count == 0:
+        return 0.0
+
+    admissible = fits[always_big].any(axis=0)
+    costs = np.sort(truck_costs[admissible])
+    return float(costs[:big_count].sum())
+
+
+def lp_bound(rect_types, counts, truck_sizes, truck_costs):
+    '''
+    LP relaxation of the cost-weighted cover:
+        min sum(cost[j] * y[j]) s.t. sum(area[j] * y[j]) >= total rect area, 0 <= y[j] <= 1
+    solved exactly by taking trucks greedily by fee per area (fractional knapsack)
+    '''
+    total_area = float((rect_types[:, 0] * rect_types[:, 1] * counts).sum())
+    truck_areas = truck_sizes[:, 0] * truck_sizes[:, 1]
+    order = np.argsort(truck_costs / truck_areas, kind='stable')
+    covered = np.cumsum(truck_areas[order])
+
+    # number of trucks taken entirely, the next one is taken fractionally
+    full = int(np.searchsorted(covered, total_area))
+    if full >= len(order):
+        return float(truck_costs.sum())
+    bound = float(truck_costs[order[:full]].sum())
+    area_before = float(covered[full - 1]) if full else 0.0
+    last = order[full]
+    return bound + truck_costs[last] * (total_area - area_before) / truck_areas[last]
+
+
+def lower_bound(rects, trucks) -> int:
+    '''
+    return a lower bound of the total cost, the max of area, L2 and LP bounds,
+    rounded up since truck costs are integers
+    '''
+    rects, truck_sizes, truck_costs = _as_arrays(rects, trucks)
+    if len(rects) == 0:
+        return 0
+
+    # items come from few distinct sizes, so work with size types instead of items
+    rect_types, counts = np.unique(np.sort(rects, axis=1), axis=0, return_counts=True)
+    fits = _fit_matrix(rect_types, truck_sizes)
+    if not fits.any(axis=1).all():
+        raise ValueError('some rectangle does not fit any truck')
+
+    bound = max(
+        area_bound(rect_types, counts, truck_sizes, truck_costs, fits),
+        l2_bound(rect_types, counts, truck_sizes, truck_costs, fits),
+        lp_bound(rect_types, counts, truck_sizes, truck_costs),
+    )
+    # guard against float noise before rounding up
+    return int(ceil(bound - 1e-9))
+
+
+def gap(cost, bound) -> float:
+    '''relative gap between the cost of a solution and the lower bound'''
+    if cost <= 0:
+        return 0.0
+    return max(cost - bound, 0) / cost
+
+
+def print_gap(cost, bound) -> None:
+    print(f'LOWER BOUND: {bound}')
+    print(f'GAP: {gap(cost, bound):.2%}')
@@ -0,0 +1,194 @@
+import argparse
+import sys
+import time
+
+from Guillotine import Item, FreeRectangle, TruckCatalog, find_best_score, split_rect, rectangle_merge
+from instance import Instance, Solution
+from perf import PerfCounters
+
+
+# -------------------------------- OPEN TRUCK --------------------------------
+class OpenTruck:
+    '''
+    a truck still accepting rects: its own free rects only, so the work and memory
+    per item depend on the open trucks, never on the number of items seen
+    '''
+    __slots__ = ('index', 'free_rects', 'area_left')
+
+    def __init__(self, index, width, height) -> None:
+        self.index = index
+        self.free_rects = [FreeRectangle(width, height, 0, 0, index)]
+        self.area_left = width * height
+
+    def can_hold(self, min_area, min_short_side) -> bool:
+        '''False once no free rect could hold even the smallest rect seen so far'''
+        return any(rect.area >= min_area and min(rect.width, rect.height) >= min_short_side
+                   for rect in self.free_rects)
+
+
+# -------------------------------- ONLINE PACKER --------------------------------
+class OnlinePacker:
+    '''
+    place each rect as soon as it arrives, in at most max_open trucks at a time:
+        the best scoring free rect over the open trucks,
+        else a new truck, the unused one with the best fee per area that holds the rect,
+        the fullest open truck is closed first when max_open trucks are already open
+    trucks that cannot hold the smallest rect seen so far are closed as well,
+    a closed truck is never reopened
+    '''
+
+    def __init__(self, instance: Instance, max_open=4, score='BAF') -> None:
+        self.instance = instance
+        self.max_open = max_open
+        self.score = score
+        # trucks by fee per area, truck_ids maps them back to the instance
+        self.truck_ids = instance.truck_order().tolist()
+        self.trucks = instance.truck_list(self.truck_ids)
+        self.catalog = TruckCatalog(self.trucks)
+        self.open = dict()
+        self.rect_count = 0
+        self.cost = 0
+        self.trucks_used = 0
+        self.min_area = float('inf')
+        self.min_short_side = float('inf')
+
+    def place(self, width, height) -> list:
+        '''
+        place the next rect, return the events it caused, in order:
+            ('close', truck) for each truck closed
+            ('place', rect, truck, rotated, x, y), truck is -1 if no truck left can hold the rect
+        rect numbers count the rects from 0, trucks are indices in the instance
+        '''
+        rect = self.rect_count
+        self.rect_count += 1
+        self.min_area = min(self.min_area, width * height)
+        self.min_short_side = min(self.min_short_side, width, height)
+        item = Item(width, height, index=rect)
+        events = list()
+
+        best = None
+        for truck in self.open.values():
+            score, free_rect, rotated = find_best_score(item, truck.free_rects, score=self.score)
+            if free_rect is not None and (best is None or score < best[0]):
+                best = (score, truck, free_rect, rotated)
+
+        if best is None:
+            if len(self.open) >= self.max_open:
+                events.append(self._close(min(self.open.values(), key=lambda t: t.area_left)))
+            # the rects to come are unknown, so no area to cover: the best fee per area holding the rect
+            position = self.catalog.best_truck(float('inf'), item)
+            if position is None:
+                events.append(('place', rect, -1, False, 0, 0))
+                return events
+            truck = OpenTruck(position, self.trucks[position][0], self.trucks[position][1])
+            self.open[position] = truck
+            self.cost += self.trucks[position][2]
+            self.trucks_used += 1
+            _, free_rect, rotated = find_best_score(item, truck.free_rects, score=self.score)
+        else:
+            _, truck, free_rect, rotated = best
+
+        truck.free_rects.remove(free_rect)
+        truck.free_rects += split_rect(free_rect, item, rotated)
+        truck.free_rects = rectangle_merge(truck.free_rects)
+        truck.area_left -= item.area
+        events.append(('place', rect, self.truck_ids[truck.index], item.rotated, free_rect.x, free_rect.y))
+
+        for truck in [t for t in self.open.values() if not t.can_hold(self.min_area, self.min_short_side)]:
+            events.append(self._close(truck))
+        return events
+
+    def _close(self, truck: OpenTruck):
+        del self.open[truck.index]
+        return ('close', self.truck_ids[truck.index])
+
+    def close_all(self) -> list:
+        '''close every open truck, at the end of the stream'''
+        return [self._close(truck) for truck in list(self.open.values())]
+
+
+# -------------------------------- STREAM --------------------------------
+def read_rects(lines):
+    '''yield (width, height) from "w h" lines, blank lines are skipped'''
+    for line in lines:
+        tokens = line.split()
+        if tokens:
+            width, height = map(int, tokens)
+            yield width, height
+
+
+def format_event(event) -> str:
+    if event[0] == 'close':
+        return f'close {event[1]}'
+    _, rect, truck, rotated, x, y = event
+    return f'place {rect} {truck} {int(rotated)} {x} {y}'
+
+
+def pack_stream(packer: OnlinePacker, rects, perf: PerfCounters):
+    '''
+    place the rects of the iterable one by one and yield the events as they happen,
+    the latency of each rect is sampled in perf (thinned, so memory stays bounded)
+    '''
+    for width, height in rects:
+        start = time.perf_counter()
+        events = packer.place(width, height)
+        perf.sample('latency', time.perf_counter() - start)
+        perf.count('rects')
+        yield from events
+    yield from packer.close_all()
+
+
+def pack_instance(instance: Instance, max_open=16, score='BAF') -> Solution:
+    '''pack the rects of the instance online, in the order of the file, as a quick solution'''
+    packer = OnlinePacker(instance, max_open=max_open, score=score)
+    solution = Solution(instance)
+    for width, height in instance.rect_list():
+        for event in packer.place(width, height):
+            if event[0] == 'place' and event[2] >= 0:
+                solution.place(*event[1:])
+    return solution
+
+
+def print_stream_stats(packer: OnlinePacker, perf: PerfCounters, seconds, file=sys.stderr) -> None:
+    latencies = sorted(latency for _, latency in perf.series.get('latency', []))
+    rect_count = perf.counts.get('rects', 0)
+    print('-------------------- ONLINE --------------------', file=file)
+    print(f'RECTS: {rect_count}', file=file)
+    print(f'NUMBER OF TRUCKS USED: {packer.trucks_used}', file=file)
+    print(f'COST: {packer.cost}', file=file)
+    print(f'Throughput: {rect_count / seconds if seconds > 0 else 0:.1f} rects/s', file=file)
+    if latencies:
+        # percentiles of the sampled latencies
+        p50, p99 = latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+        print(f'Latency per rect: p50 {p50 * 1e6:.1f} us, p99 {p99 * 1e6:.1f} us, '
+              f'max {latencies[-1] * 1e6:.1f} us', file=file)
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='pack rects online, as they arrive on stdin ("w h" per line)')
+    parser.add_argument('trucks', help='instance file, its trucks are the ones available')
+    parser.add_argument('--max-open', type=int, default=4, help='max number of trucks open at a time')
+    parser.add_argument('--score', default='BAF', choices=['BAF', 'BSSF', 'BLSF', 'WAF', 'WSSF', 'WLSF'])
+    parser.add_argument('--replay', action='store_true', help='stream the rects of the instance file instead of stdin')
+    parser.add_argument('--quiet', action='store_true', help='do not print the events, only the stats')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instance = Instance.from_file(args.trucks)
+    packer = OnlinePacker(instance, max_open=args.max_open, score=args.score)
+    rects = instance.rect_list() if args.replay else read_rects(sys.stdin)
+
+    perf = PerfCounters()
+    start = time.perf_counter()
+    for event in pack_stream(packer, rects, perf):
+        if not args.quiet:
+            print(format_event(event), flush=True)
+    print_stream_stats(packer, perf, time.perf_counter() - start)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
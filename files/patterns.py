@@ -0,0 +1,225 @@
+import argparse
+import time
+
+import numpy as np
+
+from Guillotine import Item, FreeRectangle, find_best_score, split_rect, rectangle_merge
+from instance import Instance, Solution
+from local_search import improve, print_improvement
+from lower_bound import lower_bound, print_gap
+from solution_io import write_solution
+
+
+# number of the cheapest truck types (by fee per area) whose pattern is scored at each step
+CANDIDATE_TRUCK_TYPES = 8
+
+
+# -------------------------------- AGGREGATE --------------------------------
+def _group(keys):
+    '''unique rows of keys, and the indices of the rows of each, in the order of the file'''
+    types, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind='stable')
+    members = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(types)))[:-1])
+    return types, members
+
+
+class Aggregate:
+    '''
+    the instance by types:
+        item types: (long side, short side) of the rects, as rects rotate,
+                    with the indices of the rects of each type (demand = their number)
+        truck types: (width, height, cost) of the trucks, with the indices of the trucks of each type,
+                     sorted by fee per area
+    '''
+    __slots__ = ('item_sizes', 'item_members', 'truck_types', 'truck_members')
+
+    def __init__(self, instance: Instance) -> None:
+        long_sides = np.maximum(instance.widths, instance.heights)
+        short_sides = np.minimum(instance.widths, instance.heights)
+        self.item_sizes, self.item_members = _group(np.column_stack([long_sides, short_sides]))
+
+        truck_types, truck_members = _group(np.column_stack([instance.truck_widths, instance.truck_heights,
+                                                             instance.truck_costs]))
+        order = np.argsort(truck_types[:, 2] / (truck_types[:, 0] * truck_types[:, 1]), kind='stable')
+        self.truck_types = truck_types[order]
+        self.truck_members = [truck_members[i] for i in order]
+
+    @property
+    def demand(self):
+        return np.array([len(members) for members in self.item_members])
+
+    @property
+    def available(self):
+        return np.array([len(members) for members in self.truck_members])
+
+
+# -------------------------------- PATTERNS --------------------------------
+class Pattern:
+    '''
+    a loading of a width x height truck by item types:
+        counts: number of items of each type
+        placements: (item type, placed width, placed height, x, y) of each item
+    '''
+    __slots__ = ('width', 'height', 'counts', 'placements', 'area')
+
+    def __init__(self, width, height, type_count) -> None:
+        self.width = width
+        self.height = height
+        self.counts = np.zeros(type_count, dtype=np.int64)
+        self.placements = list()
+        self.area = 0
+
+
+def build_pattern(width, height, item_sizes, demand) -> Pattern:
+    '''
+    fill one width x height truck with the demanded item types, largest first,
+    with the free rects of the guillotine heuristic (best area fit)
+    '''
+    pattern = Pattern(width, height, len(item_sizes))
+    free_rects = [FreeRectangle(width, height, 0, 0, 0)]
+    for item_type in np.argsort(-(item_sizes[:, 0] * item_sizes[:, 1]), kind='stable').tolist():
+        long_side, short_side = item_sizes[item_type].tolist()
+        while pattern.counts[item_type] < demand[item_type]:
+            item = Item(long_side, short_side)
+            _, free_rect, rotated = find_best_score(item, free_rects, score='BAF')
+            if free_rect is None:
+                break
+            free_rects.remove(free_rect)
+            free_rects += split_rect(free_rect, item, rotated)
+            free_rects = rectangle_merge(free_rects)
+            pattern.counts[item_type] += 1
+            pattern.placements.append((item_type, item.width, item.height, free_rect.x, free_rect.y))
+            pattern.area += item.area
+    return pattern
+
+
+class PatternCache:
+    '''
+    patterns by truck size and demand, the demand of a type is capped to what the truck could hold alone,
+    so the patterns of the early steps, where the demand is large, are computed once
+    '''
+
+    def __init__(self, item_sizes) -> None:
+        self.item_sizes = item_sizes
+        self.item_areas = item_sizes[:, 0] * item_sizes[:, 1]
+        self.patterns = dict()
+        self.hits = self.misses = 0
+
+    def get(self, width, height, demand) -> Pattern:
+        capped = tuple(np.minimum(demand, (width * height) // self.item_areas).tolist())
+        key = (width, height, capped)
+        if key in self.patterns:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.patterns[key] = build_pattern(width, height, self.item_sizes, capped)
+        return self.patterns[key]
+
+
+# -------------------------------- SOLVE --------------------------------
+def stamp(solution, aggregate, pattern, trucks, item_next) -> None:
+    '''
+    load the trucks with the pattern at once: each placement of the pattern takes
+    the next len(trucks) rects of its type, one per truck, with numpy
+    '''
+    instance = solution.instance
+    repeats = len(trucks)
+    for item_type, placed_width, _, x, y in pattern.placements:
+        start = item_next[item_type]
+        rects = aggregate.item_members[item_type][start: start + repeats]
+        item_next[item_type] += repeats
+        solution.truck[rects] = trucks
+        solution.rotated[rects] = instance.widths[rects] != placed_width
+        solution.x[rects] = x
+        solution.y[rects] = y
+
+
+def solve_by_patterns(instance: Instance, stats=None) -> Solution:
+    '''
+    pack the instance type by type: at each step, the pattern of the truck type with the best cost per packed area,
+    among the cheapest truck types by fee per area, is stamped into as many trucks of the type as the demand allows,
+    so the work grows with the number of types and patterns, not with the number of rects
+    '''
+    aggregate = Aggregate(instance)
+    cache = PatternCache(aggregate.item_sizes)
+    demand = aggregate.demand
+    available = aggregate.available
+    item_next = np.zeros(len(demand), dtype=np.int64)
+    truck_next = np.zeros(len(available), dtype=np.int64)
+    solution = Solution(instance)
+    steps = trucks_stamped = 0
+
+    while demand.sum() > 0:
+        best = None
+        scored = 0
+        for truck_type in np.flatnonzero(available > 0).tolist():
+            width, height, cost = aggregate.truck_types[truck_type].tolist()
+            pattern = cache.get(width, height, demand)
+            if pattern.area == 0:
+                continue
+            if best is None or cost / pattern.area < best[0]:
+                best = (cost / pattern.area, truck_type, pattern)
+            scored += 1
+            if scored == CANDIDATE_TRUCK_TYPES:
+                break
+        if best is None:
+            raise ValueError(f'no truck left to hold the rects of types {np.flatnonzero(demand).tolist()}')
+
+        _, truck_type, pattern = best
+        used_types = pattern.counts > 0
+        repeats = int(min(available[truck_type], (demand[used_types] // pattern.counts[used_types]).min()))
+        start = truck_next[truck_type]
+        stamp(solution, aggregate, pattern, aggregate.truck_members[truck_type][start: start + repeats], item_next)
+        truck_next[truck_type] += repeats
+        available[truck_type] -= repeats
+        demand -= repeats * pattern.counts
+        steps += 1
+        trucks_stamped += repeats
+
+    if stats is not None:
+        stats.update(item_types=len(aggregate.item_sizes), truck_types=len(aggregate.truck_types),
+                     steps=steps, trucks_stamped=trucks_stamped,
+                     patterns_built=cache.misses, pattern_cache_hits=cache.hits)
+    return solution
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='packing by item types with reusable truck patterns')
+    parser.add_argument('file_path')
+    parser.add_argument('--output', help='write the solution, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Solution:
+    args = parse_args(argv)
+    # time limit of the local search run after the patterns, in seconds
+    LOCAL_SEARCH_TIME_LIMIT = 1.0
+
+    instance = Instance.from_file(args.file_path)
+    start = time.perf_counter()
+    stats = dict()
+    solution = solve_by_patterns(instance, stats)
+    pattern_time = time.perf_counter() - start
+    bound = lower_bound(instance.rect_list(), instance.truck_list())
+    local_search_stats = improve(solution, time_limit=LOCAL_SEARCH_TIME_LIMIT, bound=bound)
+
+    print('-------------------- PATTERNS --------------------')
+    print(f'Item types: {stats["item_types"]}, truck types: {stats["truck_types"]}')
+    print(f'Steps: {stats["steps"]}, trucks stamped: {stats["trucks_stamped"]}, '
+          f'patterns built: {stats["patterns_built"]}, cache hits: {stats["pattern_cache_hits"]}')
+    print(f'Pattern time: {pattern_time}')
+    print_improvement(local_search_stats)
+    print(f'NUMBER OF TRUCKS USED: {len(solution.used_trucks())}')
+    print(f'COST: {solution.cost()}')
+    print_gap(solution.cost(), bound)
+    # machine-readable solution, .csv, .jsonl or .npz
+    if args.output is not None:
+        write_solution(solution, args.output)
+    return solution
+
+
+if __name__ == '__main__':
+    # the solution is left in the globals of the script, where service.run_solver reads it
+    solution = main()
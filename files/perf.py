@@ -0,0 +1,89 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+class PerfCounters:
+    '''
+    per-phase timings, counters and sampled series of a solver run,
+    cheap enough to leave enabled: a phase costs two perf_counter() calls,
+    a count one dict update, a sample one append (series are thinned past max_samples)
+    '''
+
+    def __init__(self, max_samples=1000) -> None:
+        self.start = time.perf_counter()
+        self.phases = dict()
+        self.counts = dict()
+        self.series = dict()
+        self.max_samples = max_samples
+        self._strides = dict()
+        self._current = None
+        self._current_start = 0.0
+
+    @contextmanager
+    def phase(self, name):
+        '''time the block under name, repeated phases add up'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def switch(self, name=None) -> None:
+        '''end the current phase, if any, and start the phase name (None only ends it), for straight-line scripts'''
+        now = time.perf_counter()
+        if self._current is not None:
+            self.phases[self._current] = self.phases.get(self._current, 0.0) + now - self._current_start
+        self._current, self._current_start = name, now
+
+    def count(self, name, n=1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def sample(self, name, value) -> None:
+        '''
+        record value over time, e.g. the size of a list;
+        once max_samples are kept, every other sample is dropped and the stride doubles
+        '''
+        samples = self.series.setdefault(name, [])
+        stride, seen = self._strides.get(name, (1, 0))
+        if seen % stride == 0:
+            samples.append((round(time.perf_counter() - self.start, 6), value))
+            if len(samples) > self.max_samples:
+                del samples[::2]
+                stride *= 2
+        self._strides[name] = (stride, seen + 1)
+
+    def as_dict(self) -> dict:
+        self.switch(self._current)
+        return {
+            'total_time': time.perf_counter() - self.start,
+            'phases': dict(self.phases),
+            'counts': dict(self.counts),
+            'series': {name: list(samples) for name, samples in self.series.items()},
+        }
+
+    def dump_json(self, file_path) -> None:
+        with open(file_path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+    def print_profile(self) -> None:
+        '''flat profile: phases by time spent, then counters, then the last value and max of each series'''
+        data = self.as_dict()
+        total = data['total_time']
+        print('-------------------- PROFILE --------------------')
+        for name, seconds in sorted(data['phases'].items(), key=lambda item: -item[1]):
+            print(f'{name:24} {seconds:12.6f} s {100 * seconds / total if total else 0:6.2f} %')
+        print(f'{"total":24} {total:12.6f} s')
+        for name, value in sorted(data['counts'].items()):
+            print(f'{name:24} {value:12}')
+        for name, samples in sorted(data['series'].items()):
+            if samples:
+                print(f'{name:24} last {samples[-1][1]}, max {max(value for _, value in samples)}, '
+                      f'{len(samples)} samples')
+
+    def report(self) -> None:
+        '''print the flat profile, and dump the json to $PERF_JSON if set'''
+        self.print_profile()
+        if os.environ.get('PERF_JSON'):
+            self.dump_json(os.environ['PERF_JSON'])
@@ -0,0 +1,147 @@
+import argparse
+import io
+import multiprocessing
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from batch import solve_record
+from instance import Instance, Solution
+from service import PRELOAD
+from solution_io import write_solution
+
+
+# run concurrently, one process each
+HEURISTICS = ['online', 'patterns', 'bestfit_area', 'bestfit_maxside', 'guillotine']
+# share of the deadline the heuristics get alone before CP starts from the best of them
+HEURISTIC_SHARE = 0.3
+# seconds kept at the end of the deadline to return
+MARGIN = 0.2
+
+
+def record_solution(instance, record) -> Solution:
+    '''the solution of a solver record, as built by service.solution_record'''
+    solution = Solution(instance)
+    for name in ('truck', 'rotated', 'x', 'y'):
+        getattr(solution, name)[:] = np.asarray(record['solution'][name])
+    return solution
+
+
+def print_improvement(seconds, solver, solution, file=sys.stdout) -> None:
+    print(f'IMPROVED at {seconds:.3f} s by {solver}', file=file)
+    print(f'COST: {solution.cost()}', file=file, flush=True)
+
+
+class Portfolio:
+    '''
+    anytime solve of one instance before a deadline:
+        the heuristics run concurrently, each better solution is published as it comes,
+        then, on instances small enough, CP starts from the best solution as a hint and bound,
+        and publishes each of its improvements
+    the best solution is always available as self.best,
+    publish(seconds, solver, solution, file) gets the stdout of the start, the output of CP is dropped meanwhile
+    '''
+
+    def __init__(self, file_path, deadline, exact_max_rects=40, publish=print_improvement) -> None:
+        self.file_path = file_path
+        self.deadline_seconds = deadline
+        self.exact_max_rects = exact_max_rects
+        self.publish = publish
+        self.stdout = sys.stdout
+        self.instance = Instance.from_file(file_path)
+        self.best = None
+        self.best_solver = None
+        self.history = list()
+        self.lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def offer(self, solver, solution: Solution) -> None:
+        '''keep the solution if it is complete and better than the best one, and publish it'''
+        if not solution.is_complete():
+            return
+        with self.lock:
+            if self.best is not None and solution.cost() >= self.best.cost():
+                return
+            self.best, self.best_solver = solution, solver
+            self.history.append((round(self.elapsed(), 4), solver, solution.cost()))
+            self.publish(self.elapsed(), solver, solution, self.stdout)
+
+    def _on_record(self, record) -> None:
+        if record['status'] == 'ok':
+            self.offer(record['solver'], record_solution(self.instance, record))
+
+    def run(self) -> Solution:
+        self.start = time.perf_counter()
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(PRELOAD + ['online'])
+        pool = context.Pool(len(HEURISTICS))
+        try:
+            runs = [pool.apply_async(solve_record, (solver, self.file_path, self.deadline_seconds),
+                                     callback=self._on_record) for solver in HEURISTICS]
+
+            def wait_heuristics(until):
+                for run in runs:
+                    run.wait(max(until - self.elapsed(), 0))
+
+            if self.instance.rect_count <= self.exact_max_rects:
+                wait_heuristics(HEURISTIC_SHARE * self.deadline_seconds)
+                self.refine(self.deadline_seconds - MARGIN - self.elapsed())
+            wait_heuristics(self.deadline_seconds - MARGIN)
+        finally:
+            pool.terminate()
+        return self.best
+
+    def refine(self, time_limit) -> None:
+        '''run CP from the best solution so far, its model build and search within time_limit seconds'''
+        start = time.perf_counter()
+        if time_limit <= 0:
+            return
+        from CP_model import _2DBinPackingCP
+        with self.lock:
+            hint = self.best
+        model = _2DBinPackingCP(self.file_path, time_limit, hint=hint,
+                                on_solution=lambda solution, _: self.offer('cp', solution), silent=True)
+        with redirect_stdout(io.StringIO()):
+            model.build()
+            search_seconds = time_limit - (time.perf_counter() - start)
+            if search_seconds <= 0:
+                return
+            model.solver.parameters.max_time_in_seconds = search_seconds
+            model.solve()
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='anytime solve: heuristics first, then CP refines the best of them')
+    parser.add_argument('file_path')
+    parser.add_argument('--deadline', type=float, default=30, help='seconds')
+    parser.add_argument('--exact-max-rects', type=int, default=40, help='largest instance given to CP')
+    parser.add_argument('--output', help='write the best solution, .csv, .jsonl or .npz')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    portfolio = Portfolio(args.file_path, args.deadline, args.exact_max_rects)
+    best = portfolio.run()
+    if best is None:
+        print('NO SOLUTION FOUND.')
+        return 1
+
+    print('-------------------- PORTFOLIO --------------------')
+    print(f'Best solver: {portfolio.best_solver}')
+    print(f'NUMBER OF TRUCKS USED: {len(best.used_trucks())}')
+    print(f'COST: {best.cost()}')
+    print(f'Running time: {portfolio.elapsed():.3f} s')
+    if args.output:
+        write_solution(best, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from instance import Instance, Solution
+
+
+# default directory of the cache, ignored by git
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result_cache')
+# size of the cache on disk past which the least recently used files are evicted
+DEFAULT_MAX_MB = 256
+
+# solvers whose result depends on the time limit, a proven optimal result holds for any time limit
+EXACT_SOLVERS = ('cp', 'mip')
+# exact solvers that start from a known solution
+WARM_START_SOLVERS = ('cp',)
+# parameters that only limit a run, the runs that differ by them share an incumbent
+RUN_LIMITS = ('time_limit',)
+
+# the solver proved its solution optimal, in the output of CP
+OPTIMAL_PATTERN = re.compile(r'^Status\s*:\s*OPTIMAL$', re.M)
+
+
+def instance_digest(instance: Instance) -> str:
+    '''
+    sha256 of the normalized instance: the numbers of rects and trucks, then their sizes and costs as int64,
+    so the layout of the text file does not matter
+    '''
+    digest = hashlib.sha256(np.array([instance.rect_count, instance.truck_count], dtype=np.int64).tobytes())
+    for array in (instance.widths, instance.heights,
+                  instance.truck_widths, instance.truck_heights, instance.truck_costs):
+        digest.update(array.astype(np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def solver_params(solver, command, time_limit) -> dict:
+    '''what the result of a solver depends on: its command line, and the time limit for the exact solvers'''
+    return {'command': command, 'time_limit': time_limit if solver in EXACT_SOLVERS else None}
+
+
+def is_optimal(output) -> bool:
+    return OPTIMAL_PATTERN.search(output) is not None
+
+
+class ResultCache:
+    '''
+    the solutions and records of the solver runs, on disk, content-addressed:
+        entry: by (instance digest, solver, params), the solution and record of that very run
+        incumbent: by (instance digest, solver, params but the run limits), the best solution of any run limits,
+                   to warm start an exact solver when only its time limit changed
+    each is one .npz, written to a temp file then renamed so readers never see half a file;
+    reading one marks it as used, and past max_mb the least recently used files are evicted
+    '''
+
+    def __init__(self, directory=DEFAULT_DIR, max_mb=DEFAULT_MAX_MB) -> None:
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(directory, exist_ok=True)
+        self.hits = self.misses = self.evictions = 0
+
+    def _path(self, kind, digest, solver, params) -> str:
+        if kind == 'incumbent':
+            params = {name: value for name, value in params.items() if name not in RUN_LIMITS}
+        key = hashlib.sha256(json.dumps([digest, solver, params], sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, f'{key}.{kind}.npz')
+
+    def _read(self, instance, path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                solution = Solution(instance)
+                for name in ('truck', 'rotated', 'x', 'y'):
+                    getattr(solution, name)[:] = data[name]
+                record = json.loads(str(data['record']))
+            # used now, the eviction goes by modification time
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            # missing, evicted meanwhile, or from another instance
+            return None
+        return solution, record
+
+    def _write(self, path, solution, record) -> None:
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, truck=solution.truck, rotated=solution.rotated, x=solution.x, y=solution.y,
+                     record=np.array(json.dumps(record)))
+        os.replace(tmp_path, path)
+
+    def get(self, instance, solver, params):
+        '''(solution, record) of the same run, None on a miss'''
+        cached = self._read(instance, self._path('entry', instance_digest(instance), solver, params))
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached
+
+    def incumbent(self, instance, solver, params):
+        '''(solution, record) of the best run of the solver with any run limits, None if there is none'''
+        return self._read(instance, self._path('incumbent', instance_digest(instance), solver, params))
+
+    def put(self, instance, solver, params, solution, record) -> None:
+        '''
+        store a complete solution with the record of its run (json-able, e.g. its stats and 'optimal'),
+        and keep it as the incumbent if it is better than the stored one
+        '''
+        if not solution.is_complete():
+            return
+        digest = instance_digest(instance)
+        self._write(self._path('entry', digest, solver, params), solution, record)
+        incumbent = self.incumbent(instance, solver, params)
+        if incumbent is None or solution.cost() < incumbent[0].cost() \
+                or (record.get('optimal') and not incumbent[1].get('optimal')):
+            self._write(self._path('incumbent', digest, solver, params), solution, record)
+        self.evict()
+
+    def evict(self) -> None:
+        '''remove the least recently used files until the cache fits max_mb'''
+        files = list()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def lookup(self, instance, solver, params):
+        '''
+        what the cache holds for the run, (outcome, solution, record):
+            'hit': the solution and record of the same run
+            'optimal': a proven optimal solution of the solver with other run limits, as good as a hit
+            'warm': the best solution of a warm-start solver with other run limits, to start the run from
+            'miss': nothing, solution and record are None
+        '''
+        cached = self.get(instance, solver, params)
+        if cached is not None:
+            return ('hit',) + cached
+        if solver in EXACT_SOLVERS:
+            incumbent = self.incumbent(instance, solver, params)
+            if incumbent is not None and incumbent[1].get('optimal'):
+                return ('optimal',) + incumbent
+            if incumbent is not None and solver in WARM_START_SOLVERS:
+                return ('warm',) + incumbent
+        return 'miss', None, None
@@ -0,0 +1,466 @@
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import runpy
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark import FILES_DIR, SOLVERS
+from instance import Instance, enable_cache
+from result_cache import DEFAULT_DIR, DEFAULT_MAX_MB, ResultCache, is_optimal, solver_params
+
+
+# imported once by the fork server, so every worker starts with the solvers loaded
+PRELOAD = ['numpy', 'sortedcontainers', 'ortools.sat.python.cp_model', 'ortools.linear_solver.pywraplp',
+           'instance', 'lower_bound', 'local_search', 'truck_index', 'perf', 'Guillotine', 'CP_model',
+           'bestfit']
+
+# seconds a worker gets past the time limit of its job to return before it is killed
+KILL_GRACE = 2.0
+
+# scripts whose search takes a budget: their options of the search and of the improvement after it,
+# which share the time limit of the job, less KILL_GRACE
+BUDGET_OPTIONS = {'bestfit.py': ('--budget', '--local-search'), 'decompose.py': ('--budget', '--repair-time')}
+# part of that budget given to the improvement
+IMPROVE_SHARE = 0.05
+
+
+# -------------------------------- WORKER --------------------------------
+def solver_command(solver, time_limit) -> list:
+    '''
+    command of the solver in SOLVERS, the scripts that take a budget get one that ends within the time limit,
+    the {time_limit} of the exact solvers is left for run_solver, which fills in the time limit of the job
+    '''
+    command = list(SOLVERS[solver])
+    if command[0] in BUDGET_OPTIONS and time_limit is not None:
+        seconds = max(time_limit - KILL_GRACE, 0.0)
+        search, improvement = BUDGET_OPTIONS[command[0]]
+        command += [search, f'{seconds * (1 - IMPROVE_SHARE):g}', improvement, f'{seconds * IMPROVE_SHARE:g}']
+    return command
+
+
+def run_solver(solver, file_path, time_limit, hint=None):
+    '''
+    run the solver on the instance in this process, return (solution or None, output of the solver)
+    the CP model gets the time limit, and starts from the hint solution if any,
+    the scripts with a budget get one within it (see solver_command),
+    and the solvers are killed by the pool when they exceed it
+    '''
+    output = io.StringIO()
+    with redirect_stdout(output):
+        if solver == 'cp':
+            from CP_model import _2DBinPackingCP
+            model = _2DBinPackingCP(file_path, time_limit, hint=hint)
+            model.solve()
+            solution = getattr(model, 'solution', None)
+        else:
+            script, *args = solver_command(solver, time_limit)
+            argv = sys.argv
+            sys.argv = [script] + [arg.format(file=file_path, time_limit=f'{time_limit:g}') for arg in args]
+            try:
+                solution = runpy.run_path(os.path.join(FILES_DIR, script), run_name='__main__').get('solution')
+            finally:
+                sys.argv = argv
+    return solution, output.getvalue()
+
+
+def solution_record(solution) -> dict:
+    if solution is None:
+        return {'status': 'no_solution', 'cost': None, 'trucks_used': None, 'solution': None}
+    return {
+        'status': 'ok' if solution.is_complete() else 'no_solution',
+        'cost': solution.cost(),
+        'trucks_used': len(solution.used_trucks()),
+        'solution': {'truck': solution.truck.tolist(), 'rotated': solution.rotated.tolist(),
+                     'x': solution.x.tolist(), 'y': solution.y.tolist()},
+    }
+
+
+def cached_record(cache: ResultCache, solver, file_path, time_limit):
+    '''
+    run the solver through the result cache, return (its record, with the cache outcome, output of the solver):
+    a hit, or a proven optimal solution of another time limit, is returned without running,
+    a warm-start solver starts from the best solution of its other time limits,
+    and a new complete solution is stored
+    '''
+    instance = Instance.from_file(file_path)
+    params = solver_params(solver, solver_command(solver, time_limit) if solver in SOLVERS else None, time_limit)
+    outcome, solution, stored = cache.lookup(instance, solver, params)
+    if outcome in ('hit', 'optimal'):
+        record = solution_record(solution)
+        record.update(optimal=stored.get('optimal', False), cache=outcome)
+        return record, ''
+
+    solution, output = run_solver(solver, file_path, time_limit, hint=solution)
+    record = solution_record(solution)
+    record.update(optimal=is_optimal(output), cache=outcome)
+    if record['status'] == 'ok':
+        cache.put(instance, solver, params, solution, {'optimal': record['optimal'], 'cost': record['cost']})
+    return record, output
+
+
+def _worker_loop(connection) -> None:
+    '''serve jobs sent on the connection until None is received'''
+    # lead a process group, so that the pools of the solvers die with the worker
+    os.setsid()
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            # the service is gone
+            return
+        if job is None:
+            return
+        solver, file_path, time_limit, cache_dir, cache_mb = job
+        start = time.perf_counter()
+        try:
+            if cache_dir is None:
+                solution, output = run_solver(solver, file_path, time_limit)
+                record = solution_record(solution)
+            else:
+                record, output = cached_record(ResultCache(cache_dir, cache_mb), solver, file_path, time_limit)
+        # a script may end with sys.exit(), which must not end the worker
+        except (Exception, SystemExit):
+            record = {'status': 'error', 'error': traceback.format_exc()}
+            output = ''
+        record['solve_seconds'] = time.perf_counter() - start
+        record['output'] = output
+        connection.send(record)
+
+
+class Worker:
+    '''
+    a warm worker process and the pipe to it, not a daemon so that its solvers can start pools
+    (bestfit_portfolio, decompose), the worker leads their process group, killed with it
+    '''
+    __slots__ = ('process', 'connection')
+
+    def __init__(self, context) -> None:
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_connection,))
+        self.process.start()
+        child_connection.close()
+
+    def _kill_group(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # every process of the group is gone
+            pass
+
+    def kill(self) -> None:
+        self._kill_group()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        # the worker is done, or stuck, and the pool processes it may have left go with it
+        self.kill()
+
+
+# -------------------------------- JOBS --------------------------------
+class Job:
+    '''
+    a solve request, status goes queued -> running -> one of:
+        ok, no_solution, error, timeout (killed past its time limit), cancelled
+    '''
+    __slots__ = ('id', 'solver', 'file_path', 'time_limit', 'status', 'result',
+                 'cancel_requested', 'done', 'submitted', 'started', 'finished', 'temp_file')
+
+    def __init__(self, id, solver, file_path, time_limit, temp_file=False) -> None:
+        self.id = id
+        self.solver = solver
+        self.file_path = file_path
+        self.time_limit = time_limit
+        self.status = 'queued'
+        self.result = dict()
+        self.cancel_requested = False
+        self.done = threading.Event()
+        self.submitted = time.perf_counter()
+        self.started = self.finished = None
+        self.temp_file = temp_file
+
+    def as_dict(self, output=False) -> dict:
+        record = {'id': self.id, 'solver': self.solver, 'instance': self.file_path,
+                  'time_limit': self.time_limit, 'status': self.status}
+        record.update((key, value) for key, value in self.result.items() if output or key != 'output')
+        if self.started is not None:
+            record['queue_seconds'] = self.started - self.submitted
+        if self.finished is not None:
+            record['total_seconds'] = self.finished - self.submitted
+        return record
+
+
+class WorkerPool:
+    '''
+    warm worker processes fed from one queue of jobs, first come first served,
+    a worker past the time limit of its job (plus KILL_GRACE) or whose job is cancelled
+    is killed and replaced by a new warm one,
+    with a cache directory, the workers go through the result cache (see cached_record)
+    '''
+
+    def __init__(self, workers=2, cache_dir=None, cache_mb=DEFAULT_MAX_MB) -> None:
+        self.cache_dir = cache_dir
+        self.cache_mb = cache_mb
+        self.context = multiprocessing.get_context('forkserver')
+        self.context.set_forkserver_preload(PRELOAD)
+        self.jobs = dict()
+        self.queue = queue.Queue()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.workers = [Worker(self.context) for _ in range(workers)]
+        self.threads = [threading.Thread(target=self._serve, args=(slot,), daemon=True) for slot in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, solver, file_path, time_limit, temp_file=False) -> Job:
+        if solver not in SOLVERS:
+            raise ValueError(f'unknown solver: {solver}')
+        with self.lock:
+            job = Job(next(self.ids), solver, file_path, time_limit, temp_file)
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def cancel(self, job_id) -> Job:
+        job = self.jobs[job_id]
+        with self.lock:
+            if job.status == 'queued':
+                self._finish(job, 'cancelled')
+            elif job.status == 'running':
+                job.cancel_requested = True
+        return job
+
+    def _finish(self, job, status, result=None) -> None:
+        job.status = status
+        job.result = result or dict()
+        job.finished = time.perf_counter()
+        if job.temp_file:
+            os.remove(job.file_path)
+        job.done.set()
+
+    def _serve(self, slot) -> None:
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                if job.status != 'queued':
+                    continue
+                job.status, job.started = 'running', time.perf_counter()
+
+            worker = self.workers[slot]
+            worker.connection.send((job.solver, job.file_path, job.time_limit, self.cache_dir, self.cache_mb))
+            deadline = job.started + job.time_limit + KILL_GRACE
+            while not worker.connection.poll(0.01):
+                if job.cancel_requested or time.perf_counter() > deadline:
+                    worker.kill()
+                    self.workers[slot] = Worker(self.context)
+                    with self.lock:
+                        self._finish(job, 'cancelled' if job.cancel_requested else 'timeout')
+                    break
+            else:
+                try:
+                    result = worker.connection.recv()
+                except EOFError:
+                    # the worker died during the job
+                    worker.kill()
+                    self.workers[slot] = Worker(self.context)
+                    result = {'status': 'error', 'error': f'the worker exited with code {worker.process.exitcode}'}
+                with self.lock:
+                    self._finish(job, result.pop('status'), result)
+
+    def status(self) -> dict:
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {'workers': len(self.workers),
+                'queued': statuses.count('queued'),
+                'running': statuses.count('running'),
+                'jobs': len(statuses)}
+
+    def close(self) -> None:
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        for worker in self.workers:
+            worker.stop()
+
+
+# -------------------------------- HTTP --------------------------------
+class SolveHandler(BaseHTTPRequestHandler):
+    '''
+    JSON over HTTP:
+        POST /solve         {"solver", "instance": path or "text": instance content, "time_limit", "wait", "output"}
+        GET  /jobs/<id>     status of the job, and its result once done
+        POST /jobs/<id>/cancel
+        GET  /status        number of workers and jobs
+    '''
+    pool: WorkerPool = None
+
+    def _reply(self, code, body) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job(self, part):
+        try:
+            return self.pool.jobs[int(part)]
+        except (ValueError, KeyError):
+            self._reply(404, {'error': f'no job {part}'})
+            return None
+
+    def do_GET(self) -> None:
+        parts = self.path.strip('/').split('/')
+        if parts == ['status']:
+            self._reply(200, self.pool.status())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self._job(parts[1])
+            if job is not None:
+                self._reply(200, job.as_dict())
+        else:
+            self._reply(404, {'error': f'no route {self.path}'})
+
+    def do_POST(self) -> None:
+        parts = self.path.strip('/').split('/')
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except json.JSONDecodeError as error:
+            self._reply(400, {'error': f'invalid json: {error}'})
+            return
+
+        if parts == ['solve']:
+            self._solve(request)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job = self._job(parts[1])
+            if job is not None:
+                self._reply(200, self.pool.cancel(job.id).as_dict())
+        else:
+            self._reply(404, {'error': f'no route {self.path}'})
+
+    def _solve(self, request) -> None:
+        temp_file = 'text' in request
+        if temp_file:
+            with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+                f.write(request['text'])
+            file_path = f.name
+        elif 'instance' in request:
+            file_path = os.path.abspath(request['instance'])
+            if not os.path.exists(file_path):
+                self._reply(400, {'error': f'no instance file {file_path}'})
+                return
+        else:
+            self._reply(400, {'error': 'give the instance path or its text'})
+            return
+
+        try:
+            job = self.pool.submit(request.get('solver', 'bestfit_area'), file_path,
+                                   float(request.get('time_limit', 60)), temp_file)
+        except ValueError as error:
+            if temp_file:
+                os.remove(file_path)
+            self._reply(400, {'error': str(error)})
+            return
+        if request.get('wait', True):
+            job.done.wait()
+        self._reply(200, job.as_dict(output=request.get('output', False)))
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve(host='127.0.0.1', port=8765, workers=2, cache_dir=None, cache_mb=DEFAULT_MAX_MB) -> None:
+    SolveHandler.pool = WorkerPool(workers, cache_dir, cache_mb)
+    server = ThreadingHTTPServer((host, port), SolveHandler)
+    print(f'serving on http://{host}:{port} with {workers} workers', flush=True)
+    # stop cleanly on kill as on ctrl-c
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        SolveHandler.pool.close()
+
+
+# -------------------------------- CLIENT --------------------------------
+def request(address, path, body=None) -> dict:
+    '''send a request to the service, POST if there is a body, return the decoded reply, errors included'''
+    data = json.dumps(body).encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(f'{address}{path}', data=data)) as reply:
+            return json.load(reply)
+    except urllib.error.HTTPError as error:
+        return json.load(error)
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='local solve service with warm workers')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server = commands.add_parser('serve', help='run the service')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8765)
+    server.add_argument('--workers', type=int, default=2)
+    server.add_argument('--cache', nargs='?', const=DEFAULT_DIR, default=None,
+                        help='directory of the result cache, files/result_cache if no directory is given')
+    server.add_argument('--cache-mb', type=float, default=DEFAULT_MAX_MB, help='size of the result cache')
+    server.add_argument('--cache-instances', action='store_true',
+                        help='load the instances from .npy caches next to them, written on the first load')
+
+    client = commands.add_parser('solve', help='send an instance to a running service')
+    client.add_argument('instance')
+    client.add_argument('--solver', choices=list(SOLVERS), default='bestfit_area')
+    client.add_argument('--time-limit', type=float, default=60)
+    client.add_argument('--address', default='http://127.0.0.1:8765')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'serve':
+        if args.cache_instances:
+            # before the workers start, so they inherit it
+            enable_cache()
+        serve(args.host, args.port, args.workers, args.cache, args.cache_mb)
+        return 0
+
+    start = time.perf_counter()
+    reply = request(args.address, '/solve', {'instance': os.path.abspath(args.instance),
+                                             'solver': args.solver, 'time_limit': args.time_limit})
+    if 'error' in reply:
+        print(reply['error'])
+        return 1
+    print(f'Status: {reply["status"]}')
+    print(f'COST: {reply.get("cost")}')
+    print(f'NUMBER OF TRUCKS USED: {reply.get("trucks_used")}')
+    print(f'Request time: {time.perf_counter() - start:.4f} s, solve time: {reply.get("solve_seconds", 0):.4f} s')
+    if 'cache' in reply:
+        print(f'Cache: {reply["cache"]}')
+    return 0 if reply['status'] == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
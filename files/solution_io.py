@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from instance import Instance, Solution
+
+
+# one row per rect, width and height as placed (after rotation)
+COLUMNS = ('rect', 'truck', 'rotated', 'x', 'y', 'width', 'height')
+
+
+# -------------------------------- WRITE --------------------------------
+def solution_columns(solution: Solution) -> dict:
+    '''the columns of the solution as int arrays, in one pass over the arrays'''
+    return {
+        'rect': np.arange(solution.instance.rect_count),
+        'truck': solution.truck,
+        'rotated': solution.rotated.astype(np.int8),
+        'x': solution.x,
+        'y': solution.y,
+        'width': solution.placed_widths(),
+        'height': solution.placed_heights(),
+    }
+
+
+def write_csv(solution: Solution, f) -> None:
+    np.savetxt(f, np.column_stack(list(solution_columns(solution).values())),
+               fmt='%d', delimiter=',', header=','.join(COLUMNS), comments='')
+
+
+def write_jsonl(solution: Solution, f) -> None:
+    '''one json object per rect'''
+    template = '{' + ', '.join(f'"{column}": %d' for column in COLUMNS) + '}\n'
+    rows = zip(*(column.tolist() for column in solution_columns(solution).values()))
+    f.write(''.join(template % row for row in rows))
+
+
+def write_npz(solution: Solution, f) -> None:
+    np.savez(f, **solution_columns(solution))
+
+
+def write_solution(solution: Solution, file_path) -> None:
+    '''write the solution in the format of the extension of file_path: .csv, .jsonl or .npz, - is csv on stdout'''
+    if file_path == '-':
+        write_csv(solution, sys.stdout)
+        return
+    extension = os.path.splitext(file_path)[1]
+    if extension == '.csv':
+        with open(file_path, 'w') as f:
+            write_csv(solution, f)
+    elif extension == '.jsonl':
+        with open(file_path, 'w') as f:
+            write_jsonl(solution, f)
+    elif extension == '.npz':
+        with open(file_path, 'wb') as f:
+            write_npz(solution, f)
+    else:
+        raise ValueError(f'unknown solution format: {file_path}, expected .csv, .jsonl or .npz')
+
+
+# -------------------------------- READ --------------------------------
+def read_solution_file(instance: Instance, file_path) -> Solution:
+    '''read a solution written by write_solution'''
+    extension = os.path.splitext(file_path)[1]
+    if extension == '.csv':
+        rows = np.loadtxt(file_path, dtype=np.int64, delimiter=',', skiprows=1, ndmin=2)
+        columns = dict(zip(COLUMNS, rows.T))
+    elif extension == '.jsonl':
+        with open(file_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        columns = {column: np.array([record[column] for record in records], dtype=np.int64) for column in COLUMNS}
+    elif extension == '.npz':
+        with np.load(file_path) as data:
+            columns = {column: data[column] for column in COLUMNS}
+    else:
+        raise ValueError(f'unknown solution format: {file_path}, expected .csv, .jsonl or .npz')
+
+    solution = Solution(instance)
+    solution.place(columns['rect'], columns['truck'], columns['rotated'].astype(bool), columns['x'], columns['y'])
+    return solution
+
+
+# -------------------------------- VIEW --------------------------------
+def format_solution(solution: Solution) -> str:
+    '''human-readable view, one line per rect, rects and trucks numbered from 1'''
+    return '\n'.join(
+        f'put rectangle {rect} with rotate: {rotated}, in truck {truck}, at left: {x} and bottom: {y}'
+        for rect, truck, rotated, x, y in zip(range(1, solution.instance.rect_count + 1),
+                                              (solution.truck + 1).tolist(), solution.rotated.astype(int).tolist(),
+                                              solution.x.tolist(), solution.y.tolist()))
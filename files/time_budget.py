@@ -0,0 +1,82 @@
+import time
+
+
+# fill ratio buckets of the trucks, for the success rates: [0, 0.25), [0.25, 0.5), [0.5, 0.75), [0.75, 0.9), [0.9, 1]
+FILL_BUCKETS = (0.25, 0.5, 0.75, 0.9)
+# ceiling of one attempt, in seconds per rect of its search, so the small instances do not spend
+# their whole budget on a few hopeless trucks
+ATTEMPT_SECONDS_PER_RECT = 0.01
+
+
+def fill_bucket(fill_ratio) -> int:
+    for bucket, upper in enumerate(FILL_BUCKETS):
+        if fill_ratio < upper:
+            return bucket
+    return len(FILL_BUCKETS)
+
+
+class TimeBudget:
+    '''
+    a total wall-clock budget for the fit attempts of a best-fit run, spread adaptively:
+    each attempt gets the time left per rect left, scaled by how often attempts on trucks
+    as full as this one have succeeded so far (compared to every attempt), so the time
+    goes to the promising trucks rather than to the nearly full ones that keep timing out,
+    and at most attempt_per_rect seconds per rect of the search.
+    Once the budget is spent, is_exhausted() tells the caller to stop searching
+    '''
+
+    def __init__(self, seconds, min_attempt=0.002, max_factor=4.0, attempt_per_rect=ATTEMPT_SECONDS_PER_RECT) -> None:
+        self.seconds = seconds
+        self.min_attempt = min_attempt
+        self.max_factor = max_factor
+        self.attempt_per_rect = attempt_per_rect
+        self.start = time.time()
+        bucket_count = len(FILL_BUCKETS) + 1
+        # per fill bucket: attempts, successes, timeouts, seconds spent
+        self.attempts = [0] * bucket_count
+        self.successes = [0] * bucket_count
+        self.timeouts = [0] * bucket_count
+        self.spent = [0.0] * bucket_count
+
+    def time_left(self) -> float:
+        return self.seconds - (time.time() - self.start)
+
+    def is_exhausted(self) -> bool:
+        return self.time_left() <= 0
+
+    def success_rate(self, bucket=None) -> float:
+        '''success rate of the attempts of the bucket (of every attempt if None), smoothed for the first attempts'''
+        if bucket is None:
+            return (sum(self.successes) + 1) / (sum(self.attempts) + 2)
+        return (self.successes[bucket] + 1) / (self.attempts[bucket] + 2)
+
+    def allowance(self, rects_left, fill_ratio, search_size) -> float:
+        '''
+        seconds of the next attempt, to put one of rects_left rects in a truck filled at fill_ratio,
+        with a search of search_size rects
+        '''
+        time_left = self.time_left()
+        share = time_left / max(rects_left, 1)
+        factor = self.success_rate(fill_bucket(fill_ratio)) / self.success_rate()
+        factor = min(max(factor, 1 / self.max_factor), self.max_factor)
+        return max(self.min_attempt, min(share * factor, time_left, self.attempt_per_rect * search_size))
+
+    def record(self, fill_ratio, seconds, success, timed_out) -> None:
+        bucket = fill_bucket(fill_ratio)
+        self.attempts[bucket] += 1
+        self.successes[bucket] += success
+        self.timeouts[bucket] += timed_out
+        self.spent[bucket] += seconds
+
+    def report(self) -> None:
+        '''how the budget was spent, per fill ratio of the trucks tried'''
+        print('-------------------- TIME BUDGET --------------------')
+        print(f'Budget: {self.seconds} s, spent on attempts: {sum(self.spent):.3f} s, '
+              f'elapsed: {time.time() - self.start:.3f} s')
+        print(f'{"truck fill":12} {"attempts":>9} {"success":>8} {"timeouts":>9} {"seconds":>9}')
+        bounds = (0.0,) + FILL_BUCKETS + (1.0,)
+        for bucket in range(len(self.attempts)):
+            if self.attempts[bucket]:
+                print(f'{f"{bounds[bucket]:.2f}-{bounds[bucket + 1]:.2f}":12} {self.attempts[bucket]:9} '
+                      f'{self.successes[bucket] / self.attempts[bucket]:8.1%} {self.timeouts[bucket]:9} '
+                      f'{self.spent[bucket]:9.3f}')
@@ -0,0 +1,67 @@
+class TruckIndex:
+    '''
+    segment tree over the trucks, kept in the given order (by fee per area),
+    to find the trucks that can possibly hold a rect without scanning every truck.
+    Each node keeps, over the trucks below it:
+        the max area left, the max longer side, the max shorter side
+    so a whole subtree is skipped when none of its trucks can hold the rect
+    '''
+
+    def __init__(self, trucks, areas_left=None) -> None:
+        self.truck_count = len(trucks)
+        size = 1
+        while size < max(self.truck_count, 1):
+            size *= 2
+        self.size = size
+
+        # leaves are at [size, 2*size), empty leaves can never hold anything
+        self.area_left = [-1] * (2 * size)
+        self.long_side = [-1] * (2 * size)
+        self.short_side = [-1] * (2 * size)
+        for position, truck in enumerate(trucks):
+            leaf = size + position
+            self.area_left[leaf] = truck[0] * truck[1] if areas_left is None else areas_left[position]
+            self.long_side[leaf] = max(truck[0], truck[1])
+            self.short_side[leaf] = min(truck[0], truck[1])
+
+        for node in range(size - 1, 0, -1):
+            self.area_left[node] = max(self.area_left[2 * node], self.area_left[2 * node + 1])
+            self.long_side[node] = max(self.long_side[2 * node], self.long_side[2 * node + 1])
+            self.short_side[node] = max(self.short_side[2 * node], self.short_side[2 * node + 1])
+
+    def update(self, position, area_left) -> None:
+        '''set the area left of the truck at position, O(log T)'''
+        node = self.size + position
+        self.area_left[node] = area_left
+        node //= 2
+        while node:
+            new_value = max(self.area_left[2 * node], self.area_left[2 * node + 1])
+            if self.area_left[node] == new_value:
+                break
+            self.area_left[node] = new_value
+            node //= 2
+
+    def candidates(self, rect, area_rect=None, sides=True):
+        '''
+        yield the positions of the trucks that may hold the rect, in ascending order:
+        enough area left, and if sides, the rect sides fit the truck sides in some orientation
+        (without, the caller checks them, e.g. to count the trucks they rule out).
+        The index can be updated while iterating, later positions see the update
+        '''
+        if area_rect is None:
+            area_rect = rect[0] * rect[1]
+        long_rect, short_rect = (max(rect[0], rect[1]), min(rect[0], rect[1])) if sides else (0, 0)
+
+        stack = [1]
+        while stack:
+            node = stack.pop()
+            if self.area_left[node] < area_rect \
+                    or self.long_side[node] < long_rect \
+                    or self.short_side[node] < short_rect:
+                continue
+            if node >= self.size:
+                yield node - self.size
+            else:
+                # right child first, so the left one is popped first
+                stack.append(2 * node + 1)
+                stack.append(2 * node)
@@ -0,0 +1,184 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+import numpy as np
+from sortedcontainers import SortedList
+
+from instance import Instance, Solution
+from solution_io import read_solution_file
+
+
+# text output with one line per rect of CP and MIP (solution_io.format_solution), numbers are 1-based
+PLACEMENT_PATTERN = re.compile(
+    r'^put rectangle (\d+) with rotate: (\d), in truck (\d+), at left: (\d+) and bottom: (\d+)$', re.M)
+
+
+# -------------------------------- CHECKS --------------------------------
+def check_placed(solution: Solution) -> list:
+    '''every rect is in an existing truck'''
+    bad = np.flatnonzero((solution.truck < 0) | (solution.truck >= solution.instance.truck_count))
+    return [f'rect {rect} is not in a truck (truck {solution.truck[rect]})' for rect in bad[:10].tolist()] + \
+        ([f'... {len(bad) - 10} more rects not in a truck'] if len(bad) > 10 else [])
+
+
+def check_bounds(solution: Solution) -> list:
+    '''every rect lies inside its truck, vectorized over the rects'''
+    instance = solution.instance
+    truck = solution.truck
+    right, top = solution.x + solution.placed_widths(), solution.y + solution.placed_heights()
+    bad = np.flatnonzero((solution.x < 0) | (solution.y < 0)
+                         | (right > instance.truck_widths[truck]) | (top > instance.truck_heights[truck]))
+    return [f'rect {rect} at ({solution.x[rect]}, {solution.y[rect]}) -> ({right[rect]}, {top[rect]}) '
+            f'is out of truck {truck[rect]} ({instance.truck_widths[truck[rect]]} x {instance.truck_heights[truck[rect]]})'
+            for rect in bad.tolist()]
+
+
+def find_overlaps(solution: Solution) -> list:
+    '''
+    return the overlapping pairs of rects (rect, other), at most one per truck, in O(n log n):
+    sweep along x over the starts and ends of the rects, trucks one after the other,
+    the rects crossing the sweep line have disjoint y intervals as long as nothing overlaps,
+    so a new rect can only overlap its neighbours in the sorted intervals.
+    Rects sharing an edge do not overlap: at the same x, ends come before starts
+    '''
+    rect_count = solution.instance.rect_count
+    left, right = solution.x, solution.x + solution.placed_widths()
+    bottom, top = solution.y.tolist(), (solution.y + solution.placed_heights()).tolist()
+
+    rects = np.concatenate([np.arange(rect_count), np.arange(rect_count)])
+    xs = np.concatenate([right, left])
+    # 0 = end, 1 = start
+    kinds = np.concatenate([np.zeros(rect_count, dtype=np.int8), np.ones(rect_count, dtype=np.int8)])
+    trucks = np.concatenate([solution.truck, solution.truck])
+    order = np.lexsort((kinds, xs, trucks))
+
+    overlaps = list()
+    active = SortedList()
+    current_truck = skip_truck = None
+    for truck, kind, rect in zip(trucks[order].tolist(), kinds[order].tolist(), rects[order].tolist()):
+        if truck != current_truck:
+            current_truck = truck
+            active.clear()
+        if truck == skip_truck:
+            continue
+        interval = (bottom[rect], top[rect], rect)
+        if kind == 0:
+            active.remove(interval)
+            continue
+
+        position = active.bisect_left(interval)
+        other = None
+        if position > 0 and active[position - 1][1] > interval[0]:
+            other = active[position - 1][2]
+        elif position < len(active) and active[position][0] < interval[1]:
+            other = active[position][2]
+        if other is not None:
+            # the invariant no longer holds in this truck, go on with the next one
+            overlaps.append((other, rect))
+            skip_truck = truck
+            continue
+        active.add(interval)
+    return overlaps
+
+
+def verify(solution: Solution, reported_cost=None) -> list:
+    '''
+    check a solution: every rect in an existing truck, inside it, without overlap,
+    and the reported cost equal to the cost of the used trucks,
+    return the errors found, none if the solution is valid
+    '''
+    errors = check_placed(solution)
+    if errors:
+        return errors
+    errors = check_bounds(solution)
+    for rect, other in find_overlaps(solution):
+        errors.append(f'rects {rect} and {other} overlap in truck {solution.truck[rect]}')
+    if reported_cost is not None and round(float(reported_cost)) != solution.cost():
+        errors.append(f'reported cost {reported_cost}, the used trucks cost {solution.cost()}')
+    return errors
+
+
+# -------------------------------- READ SOLUTIONS --------------------------------
+def solution_from_arrays(instance, truck, rotated, x, y) -> Solution:
+    solution = Solution(instance)
+    solution.truck[:] = truck
+    solution.rotated[:] = rotated
+    solution.x[:] = x
+    solution.y[:] = y
+    return solution
+
+
+def parse_solution(instance: Instance, text):
+    '''
+    parse a solution of the instance, return (solution, reported cost or None) from:
+        json with a "solution" of truck, rotated, x, y arrays (service, batch, portfolio outputs)
+        the text output of CP.py or MIP.py
+    None if there is no solution in the text
+    '''
+    try:
+        record = json.loads(text)
+    except json.JSONDecodeError:
+        record = None
+
+    if record is not None:
+        if isinstance(record, list):
+            record = record[0]
+        arrays = record['solution']
+        return (solution_from_arrays(instance, arrays['truck'], arrays['rotated'], arrays['x'], arrays['y']),
+                record.get('cost'))
+
+    placements = np.array([match.groups() for match in PLACEMENT_PATTERN.finditer(text)],
+                          dtype=np.int64).reshape(-1, 5)
+    if not len(placements):
+        return None
+    solution = Solution(instance)
+    rects = placements[:, 0] - 1
+    solution.place(rects, placements[:, 2] - 1, placements[:, 1].astype(bool), placements[:, 3], placements[:, 4])
+    cost = re.findall(r'^(?:COST|Min cost): (\S+)$', text, re.M)
+    return solution, cost[-1] if cost else None
+
+
+def read_solution(instance: Instance, file_path):
+    '''
+    read a solution file of the instance, return (solution, reported cost or None):
+    a file written by solution_io (.csv, .jsonl, .npz, no cost), else see parse_solution
+    '''
+    if file_path.endswith(('.csv', '.jsonl', '.npz')):
+        return read_solution_file(instance, file_path), None
+    with open(file_path) as f:
+        parsed = parse_solution(instance, f.read())
+    if parsed is None:
+        raise ValueError(f'{file_path}: no solution found')
+    return parsed
+
+
+# -------------------------------- MAIN --------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='check that a solution is valid and recompute its cost')
+    parser.add_argument('instance', help='instance file')
+    parser.add_argument('solution', help='.csv, .jsonl or .npz solution, json of the service, '
+                                         'or the text output of CP.py / MIP.py')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instance = Instance.from_file(args.instance)
+    solution, reported_cost = read_solution(instance, args.solution)
+
+    start = time.perf_counter()
+    errors = verify(solution, reported_cost)
+    seconds = time.perf_counter() - start
+
+    for error in errors:
+        print(f'ERROR {error}')
+    print(f'{"VALID" if not errors else "INVALID"}: {instance.rect_count} rects, '
+          f'{len(solution.used_trucks())} trucks, cost {solution.cost()}, checked in {seconds:.4f} s')
+    return 0 if not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import os
+import sys
+import time
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files')
+sys.path.insert(0, FILES_DIR)
+
+from bestfit import solve  # noqa: E402
+from instance import Instance  # noqa: E402
+from verify import verify  # noqa: E402
+
+
+def test_small_instance_does_not_spend_the_budget():
+    '''12 rects with the default 60 s budget: the hopeless trucks only get their ceiling, not the budget'''
+    instance = Instance.from_file(os.path.join(FILES_DIR, 'generated_data', '0012.txt'))
+    for rect_key in ('area', 'max_side_length'):
+        start = time.perf_counter()
+        solution = solve(instance, rect_key)
+        assert time.perf_counter() - start < 1.0
+        assert not verify(solution)